@@ -0,0 +1,168 @@
+"""
+End to end throughput benchmark of rp_cli against the local mock report portal.
+
+feed_results runs for every strategy on synthetic xunit files, with and without
+logs attached to the failed test cases, import_results runs on the zipped xunit.
+Every run happens in its own process, so the peak RSS is measured per run.
+
+Usage: python benchmarks/bench_e2e.py [--cases 1000 10000 100000 500000] [--strategies Rhv Raut]
+                                      [--latency 0.0] [--error_rate 0.0] [--server_max_rps 0]
+                                      [--rp_cli_args ...]
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+try:
+    from urllib.request import urlopen, Request
+except ImportError:
+    from urllib2 import urlopen, Request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from xunit_gen import write_xunit  # noqa: E402
+from mock_rp import start_server  # noqa: E402
+
+STRATEGIES = ["Rhv", "Raut", "Cfme", "Cnv"]
+
+
+def server_call(url, path, method="GET"):
+    return json.loads(urlopen(Request(url + path, data=b"" if method == "POST" else None)).read().decode("utf-8"))
+
+
+def write_test_logs(xunit_file, logs_dir, strategy_name, log_size=16 * 1024):
+    """
+    Creates two log files for every failed test case of the xunit file.
+    """
+    import rp_cli
+
+    strategy = getattr(rp_cli, strategy_name)()
+    content = b"x" * log_size
+    for case in rp_cli.iter_xunit_cases(xunit_file):
+        if case.status != 'FAILED':
+            continue
+        path = os.path.join(logs_dir, strategy.get_logs_per_test_path(case))
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        for name in ("engine.log", "vdsm.log"):
+            with open(os.path.join(path, name), "wb") as fh:
+                fh.write(content)
+
+
+def run_child(args):
+    import rp_cli
+
+    config = {
+        "rp_endpoint": args.endpoint,
+        "rp_uuid": "bench",
+        "rp_project": "bench",
+        "launch_tags": "bench",
+        "launch_name": "bench",
+    }
+    config.update(json.loads(args.config))
+
+    start = time.time()
+    if args.run == "import":
+        rp = rp_cli.RpManager(config, strategy=rp_cli.Strategy())
+        rp.import_results()
+    else:
+        rp = rp_cli.RpManager(config, strategy=getattr(rp_cli, args.run)())
+        rp.feed_results()
+    elapsed = time.time() - start
+
+    print(json.dumps({
+        "elapsed": elapsed,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }))
+
+
+def run(url, target, config):
+    server_call(url, "/__reset", "POST")
+    output = subprocess.check_output([
+        sys.executable, __file__, "--run", target, "--endpoint", url, "--config", json.dumps(config)
+    ])
+    result = json.loads(output.decode("utf-8").strip().splitlines()[-1])
+    result.update(server_call(url, "/__stats"))
+    return result
+
+
+def main():
+    bench_parser = argparse.ArgumentParser()
+    bench_parser.add_argument("--cases", type=int, nargs="+", default=[1000, 10000])
+    bench_parser.add_argument("--strategies", nargs="+", default=STRATEGIES, choices=STRATEGIES)
+    bench_parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every mock response")
+    bench_parser.add_argument("--error_rate", type=float, default=0.0, help="Part of mock requests failing")
+    bench_parser.add_argument("--server_max_rps", type=int, default=None,
+                              help="Requests per second above which the mock answers 429")
+    bench_parser.add_argument("--rp_cli_args", type=str, default="{}",
+                              help="JSON object of extra rp_cli options, e.g. '{\"streaming\": true}'")
+    # internal: a single run in the child process
+    bench_parser.add_argument("--run", type=str, help=argparse.SUPPRESS)
+    bench_parser.add_argument("--endpoint", type=str, help=argparse.SUPPRESS)
+    bench_parser.add_argument("--config", type=str, help=argparse.SUPPRESS)
+    args = bench_parser.parse_args()
+
+    if args.run:
+        run_child(args)
+        return
+
+    server = start_server(latency=args.latency, error_rate=args.error_rate, max_rps=args.server_max_rps)
+    url = "http://127.0.0.1:%s" % (server.server_address[1], )
+    extra = json.loads(args.rp_cli_args)
+    tmp_dir = tempfile.mkdtemp(prefix="rp_cli-bench-")
+
+    header = "{0:<8} {1:>8} {2:>6} {3:>9} {4:>10} {5:>9} {6:>7} {7:>7} {8:>10}".format(
+        "run", "cases", "logs", "time", "cases/s", "requests", "errors", "429s", "peak RSS")
+    print(header)
+    print("-" * len(header))
+    try:
+        for cases in args.cases:
+            xunit_file = os.path.join(tmp_dir, "xunit_%s.xml" % (cases, ))
+            write_xunit(xunit_file, cases)
+
+            runs = []
+            for strategy_name in args.strategies:
+                runs.append((strategy_name, False))
+                # Cnv does not implement logs per test
+                if strategy_name != "Cnv":
+                    runs.append((strategy_name, True))
+            runs.append(("import", False))
+
+            for target, with_logs in runs:
+                config = dict(extra)
+                if target == "import":
+                    zip_file = os.path.join(tmp_dir, "xunit_%s.zip" % (cases, ))
+                    with zipfile.ZipFile(zip_file, "w", zipfile.ZIP_DEFLATED) as archive:
+                        archive.write(xunit_file, os.path.basename(xunit_file))
+                    config["upload_xunit"] = zip_file
+                else:
+                    config["xunit_feed"] = xunit_file
+                if with_logs:
+                    logs_dir = os.path.join(tmp_dir, "logs_%s_%s" % (target, cases))
+                    write_test_logs(xunit_file, logs_dir, target)
+                    config["test_logs"] = logs_dir
+
+                result = run(url, target, config)
+                print("{0:<8} {1:>8} {2:>6} {3:>8.2f}s {4:>10.0f} {5:>9} {6:>7} {7:>7} {8:>7.1f} MB".format(
+                    target, cases, "yes" if with_logs else "no", result["elapsed"],
+                    cases / result["elapsed"], result["requests_total"], result["errors"], result["throttled"],
+                    result["peak_rss_kb"] / 1024.0,
+                ))
+
+                if with_logs:
+                    shutil.rmtree(logs_dir)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
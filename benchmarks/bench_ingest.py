@@ -0,0 +1,63 @@
+"""
+Compares peak memory and time of the whole-document xunit parsing
+with the streaming (--streaming) one.
+
+Usage: python benchmarks/bench_ingest.py [--cases 200000]
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from xunit_gen import write_xunit  # noqa: E402
+
+
+def run_mode(mode, path):
+    import rp_cli
+
+    start = time.time()
+    if mode == "streaming":
+        cases = rp_cli.iter_xunit_cases(path)
+    else:
+        cases = rp_cli.load_xunit_cases(path)
+    count = 0
+    for case in cases:
+        # touch the case like the strategies do
+        count += len(case.classname)
+    elapsed = time.time() - start
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print("{0:<10} {1:>8.2f}s {2:>10.1f} MB".format(mode, elapsed, peak_kb / 1024.0))
+
+
+def main():
+    bench_parser = argparse.ArgumentParser()
+    bench_parser.add_argument("--cases", type=int, default=200000)
+    bench_parser.add_argument("--mode", choices=["whole", "streaming"])
+    bench_parser.add_argument("--xunit", type=str)
+    args = bench_parser.parse_args()
+
+    if args.mode:
+        run_mode(args.mode, args.xunit)
+        return
+
+    tmp_dir = tempfile.mkdtemp()
+    path = os.path.join(tmp_dir, "bench_xunit.xml")
+    write_xunit(path, args.cases)
+    print("{0} cases, {1:.1f} MB xunit".format(args.cases, os.path.getsize(path) / 1024.0 / 1024.0))
+    print("{0:<10} {1:>9} {2:>13}".format("mode", "time", "peak RSS"))
+    try:
+        # every mode runs in its own process so the peak RSS is not shared
+        for mode in ("whole", "streaming"):
+            subprocess.check_call([sys.executable, __file__, "--mode", mode, "--xunit", path])
+    finally:
+        os.remove(path)
+        os.rmdir(tmp_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Compares the compiled test owners matcher with scanning every owner pattern per test case.
+
+Usage: python benchmarks/bench_owner_matcher.py
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rp_cli  # noqa: E402
+from xunit_gen import TEAMS  # noqa: E402
+
+
+def naive_owner(classname, test_owners):
+    for owner in test_owners.keys():
+        for test in test_owners.get(owner):
+            if test in classname:
+                return owner
+
+
+def make_test_owners(patterns, rnd):
+    test_owners = {}
+    for i in range(patterns):
+        owner = "owner{0}".format(i % 50)
+        pattern = "{team}.module_{mod}".format(team=rnd.choice(TEAMS), mod=rnd.randint(0, patterns))
+        test_owners.setdefault(owner, []).append(pattern)
+    return test_owners
+
+
+def make_classnames(cases, patterns, rnd):
+    return [
+        "tests.{team}.module_{mod}.TestClass{cls}".format(
+            team=rnd.choice(TEAMS), mod=rnd.randint(0, patterns * 2), cls=rnd.randint(0, 20)
+        )
+        for _ in range(cases)
+    ]
+
+
+def main():
+    rnd = random.Random(0)
+    print("{0:>8} {1:>8} {2:>10} {3:>10} {4:>9}".format("patterns", "cases", "naive", "compiled", "speedup"))
+    for patterns in (100, 1000, 3000):
+        for cases in (10000, 50000):
+            test_owners = make_test_owners(patterns, rnd)
+            classnames = make_classnames(cases, patterns, rnd)
+
+            start = time.time()
+            expected = [naive_owner(classname, test_owners) for classname in classnames]
+            naive = time.time() - start
+
+            start = time.time()
+            compiled_owners = rp_cli.TestOwners(test_owners)
+            result = [compiled_owners.match(classname) for classname in classnames]
+            compiled = time.time() - start
+
+            assert result == expected, "compiled matcher disagrees with the naive scan"
+            print("{0:>8} {1:>8} {2:>9.2f}s {3:>9.2f}s {4:>8.1f}x".format(
+                patterns, cases, naive, compiled, naive / compiled))
+
+
+if __name__ == "__main__":
+    main()
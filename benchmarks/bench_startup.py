@@ -0,0 +1,81 @@
+"""
+Measures the startup time of rp_cli: importing the module, printing the usage and
+parsing a configuration file with a big test_owners map, without and with the
+cache of the compiled test_owners.
+
+Every run is a new python process, like an rp_cli invocation of a CI job.
+
+Usage: python benchmarks/bench_startup.py [--runs 20] [--owners 2000]
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+RP_CLI_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RP_CLI = os.path.join(RP_CLI_DIR, "rp_cli.py")
+
+
+def write_config(path, owners):
+    with open(path, "w") as config:
+        config.write("rp_endpoint: http://localhost:8080\n")
+        config.write("rp_uuid: 1111111-1111-1111-1111-111111\n")
+        config.write("rp_project: bench\n")
+        config.write("test_owners:\n")
+        for owner in range(owners):
+            config.write("  team{0}:\n".format(owner))
+            for pattern in range(5):
+                config.write("    - tests.component{0}.test_area{1}\n".format(owner, pattern))
+
+
+def time_runs(command, runs, env, before=None):
+    timings = []
+    for _ in range(runs):
+        if before is not None:
+            before()
+        start = time.time()
+        subprocess.check_call(command, env=env, cwd=RP_CLI_DIR, stdout=subprocess.DEVNULL)
+        timings.append(time.time() - start)
+    timings.sort()
+    return timings[len(timings) // 2], timings[0]
+
+
+def main():
+    bench_parser = argparse.ArgumentParser()
+    bench_parser.add_argument("--runs", type=int, default=20)
+    bench_parser.add_argument("--owners", type=int, default=2000)
+    args = bench_parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    config = os.path.join(tmp_dir, "rp_conf.yaml")
+    cache_dir = os.path.join(tmp_dir, "cache")
+    write_config(config, args.owners)
+    env = dict(os.environ, RP_CLI_CACHE_DIR=cache_dir)
+
+    def drop_cache():
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    parse_config = [sys.executable, "-c", "import rp_cli; rp_cli.parse_configuration_file({0!r})".format(config)]
+    cases = [
+        ("python", [sys.executable, "-c", "pass"], None),
+        ("import", [sys.executable, "-c", "import rp_cli"], None),
+        ("--help", [sys.executable, RP_CLI, "--help"], None),
+        ("config cold", parse_config, drop_cache),
+        ("config cached", parse_config, None),
+    ]
+    print("{0} runs, {1} owners ({2:.1f} KB config)".format(
+        args.runs, args.owners, os.path.getsize(config) / 1024.0))
+    print("{0:<14} {1:>10} {2:>10}".format("run", "median", "best"))
+    try:
+        for name, command, before in cases:
+            median, best = time_runs(command, args.runs, env, before)
+            print("{0:<14} {1:>9.1f}ms {2:>9.1f}ms".format(name, median * 1000, best * 1000))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == "__main__":
+    main()
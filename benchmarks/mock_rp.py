@@ -0,0 +1,265 @@
+"""
+Lightweight local stand-in of the report portal API endpoints used by rp_cli.
+
+Every request is counted and its body is read and thrown away. Latency and errors
+can be injected to see how rp_cli behaves against a slow or flaky server, --max_rps
+answers the requests above the rate with 429 and Retry-After like an overloaded server.
+Like report portal 4 it starts a new launch for a rerun request, --rerun reopens the
+launch rerunOf like report portal 5.
+
+Usage: python benchmarks/mock_rp.py [--port 8080] [--latency 0.01] [--error_rate 0.01] [--max_rps 100]
+       then use http://127.0.0.1:8080 as rp_endpoint
+
+GET /__stats returns the request counters, POST /__reset clears them.
+"""
+import argparse
+import collections
+import json
+import random
+import re
+import threading
+import time
+import uuid
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+# (method, path pattern below /api/v1/<project>/, endpoint name)
+ROUTES = [
+    ("POST", r"launch/import", "launch_import"),
+    ("POST", r"launch", "launch_start"),
+    ("PUT", r"launch/[^/]+/finish", "launch_finish"),
+    ("PUT", r"launch/[^/]+/stop", "launch_stop"),
+    ("PUT", r"launch/[^/]+/update", "launch_update"),
+    ("GET", r"launch/[^/]+", "launch_get"),
+    ("POST", r"item(/[^/]+)?", "item_start"),
+    ("PUT", r"item/[^/]+", "item_finish"),
+    ("POST", r"log", "log"),
+]
+API_PATH = re.compile(r"^/api/v1/[^/]+/(?P<path>[^?]*?)/?(\?.*)?$")
+READ_CHUNK = 64 * 1024
+
+
+class Stats(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = collections.Counter()
+            # ids of the launches and items created so far
+            self.ids = set()
+            self.errors = 0
+            self.throttled = 0
+            self.bytes_received = 0
+            self.log_entries = 0
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                "requests": dict(self.requests),
+                "requests_total": sum(self.requests.values()),
+                "errors": self.errors,
+                "throttled": self.throttled,
+                "bytes_received": self.bytes_received,
+                "log_entries": self.log_entries,
+            }
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, error_rate=0.0, error_status=503, max_rps=None, rerun=False):
+        HTTPServer.__init__(self, address, MockRpHandler)
+        self.rerun = rerun
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.max_rps = max_rps
+        self.window = 0
+        self.window_requests = 0
+        self.stats = Stats()
+
+    def throttle(self):
+        """
+        Returns: True if the request is above --max_rps
+        """
+        if not self.max_rps:
+            return False
+        with self.stats.lock:
+            second = int(time.time())
+            if second != self.window:
+                self.window = second
+                self.window_requests = 0
+            self.window_requests += 1
+            if self.window_requests <= self.max_rps:
+                return False
+            self.stats.throttled += 1
+            return True
+
+
+class MockRpHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body are written separately, do not let them wait for delayed ACKs
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _read_body(self):
+        """
+        Reads (and drops) the request body, returns its size and its first READ_CHUNK bytes
+        """
+        size = 0
+        first = b""
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            while True:
+                chunk_size = int(self.rfile.readline().split(b";")[0].strip(), 16)
+                if chunk_size == 0:
+                    # trailing headers end with an empty line
+                    while self.rfile.readline() not in (b"\r\n", b"\n", b""):
+                        pass
+                    break
+                data = self.rfile.read(chunk_size)
+                if len(first) < READ_CHUNK:
+                    first += data[:READ_CHUNK - len(first)]
+                size += len(data)
+                self.rfile.readline()
+        else:
+            left = int(self.headers.get("Content-Length") or 0)
+            while left > 0:
+                data = self.rfile.read(min(READ_CHUNK, left))
+                if not data:
+                    break
+                if len(first) < READ_CHUNK:
+                    first += data[:READ_CHUNK - len(first)]
+                size += len(data)
+                left -= len(data)
+        return size, first
+
+    def _respond(self, status, data, headers=None):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _log_entries(self, first_chunk):
+        if b"json_request_part" not in first_chunk:
+            return 1
+        match = re.search(br"\r\n\r\n(\[.*?\])\r\n--", first_chunk, re.S)
+        return len(json.loads(match.group(1).decode("utf-8"))) if match else 1
+
+    def _handle(self, method):
+        server = self.server
+        size, first_chunk = self._read_body()
+
+        if self.path.startswith("/__stats"):
+            return self._respond(200, server.stats.as_dict())
+        if self.path.startswith("/__reset"):
+            server.stats.reset()
+            return self._respond(200, {})
+        if server.throttle():
+            return self._respond(429, {"error_code": 4290, "message": "Too many requests"}, {"Retry-After": "1"})
+
+        match = API_PATH.match(self.path)
+        endpoint = None
+        if match:
+            for route_method, pattern, name in ROUTES:
+                if route_method == method and re.match("^" + pattern + "$", match.group("path")):
+                    endpoint = name
+                    break
+
+        if server.latency:
+            time.sleep(server.latency)
+
+        new_id = uuid.uuid4().hex
+        if endpoint == "launch_start" and server.rerun and b'"rerunOf"' in first_chunk:
+            new_id = json.loads(first_chunk.decode("utf-8")).get("rerunOf") or new_id
+        with server.stats.lock:
+            # a test item can be started, finished and logged to only once its parent exists
+            if endpoint in ("item_start", "item_finish", "launch_finish", "launch_update") and match:
+                referenced = match.group("path").split("/")[1:2]
+                if referenced and referenced[0] not in server.stats.ids:
+                    endpoint = None
+            server.stats.requests[endpoint or "unknown"] += 1
+            server.stats.bytes_received += size
+            if endpoint == "log":
+                server.stats.log_entries += self._log_entries(first_chunk)
+            failed = endpoint is None or random.random() < server.error_rate
+            if failed:
+                server.stats.errors += 1
+            elif endpoint in ("launch_start", "item_start", "launch_import"):
+                server.stats.ids.add(new_id)
+
+        if endpoint is None:
+            return self._respond(404, {"error_code": 4040, "message": "Not found: %s %s" % (method, self.path)})
+        if failed:
+            return self._respond(server.error_status, {"error_code": 5000, "message": "Injected error"})
+
+        if endpoint == "launch_import":
+            return self._respond(200, {"msg": "Launch with id = %s is successfully imported." % (new_id, )})
+        if endpoint in ("launch_start", "item_start"):
+            return self._respond(201, {"id": new_id})
+        if endpoint == "launch_get":
+            return self._respond(200, {"id": match.group("path").split("/")[1], "status": "PASSED"})
+        if endpoint == "log":
+            if b"json_request_part" in first_chunk:
+                return self._respond(201, {"responses": [{"id": new_id}]})
+            return self._respond(201, {"id": new_id})
+        return self._respond(200, {"msg": "%s is done" % (endpoint, )})
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+
+def start_server(port=0, latency=0.0, error_rate=0.0, error_status=503, max_rps=None, rerun=False):
+    """
+    Starts the mock server in a background thread.
+
+    Returns: server, its url is "http://127.0.0.1:%s" % server.server_address[1]
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), latency, error_rate, error_status, max_rps, rerun)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def main():
+    mock_parser = argparse.ArgumentParser()
+    mock_parser.add_argument("--port", type=int, default=8080)
+    mock_parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    mock_parser.add_argument("--error_rate", type=float, default=0.0, help="Part of the requests failing")
+    mock_parser.add_argument("--error_status", type=int, default=503, help="Status code of the injected errors")
+    mock_parser.add_argument("--max_rps", type=int, default=None, help="Requests per second answered with 429 above")
+    mock_parser.add_argument("--rerun", action="store_true", help="Reopen the launch of a rerun request (RP 5)")
+    args = mock_parser.parse_args()
+
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", args.port), args.latency, args.error_rate, args.error_status, args.max_rps, args.rerun
+    )
+    print("Mock report portal listening on http://127.0.0.1:%s" % (args.port, ))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+Generates synthetic xunit files for the rp_cli benchmarks.
+"""
+import random
+
+TEAMS = ["compute", "network", "storage", "virt", "infra", "sla", "ui", "upgrade"]
+
+
+def write_xunit(path, cases, failure_ratio=0.05, skip_ratio=0.05, system_out_size=200, seed=0):
+    """
+    Writes xunit file with the given number of test cases.
+
+    Args:
+        path: destination file
+        cases: number of test cases
+        failure_ratio: part of the cases which fail
+        skip_ratio: part of the cases which are skipped
+        system_out_size: length of system_out text of every case
+        seed: random seed, the same seed produces the same file
+    """
+    rnd = random.Random(seed)
+    out = "x" * system_out_size
+    with open(path, "w") as fd:
+        fd.write('<?xml version="1.0" encoding="utf-8"?>\n')
+        fd.write('<testsuite name="bench" tests="{0}">\n'.format(cases))
+        for i in range(cases):
+            team = rnd.choice(TEAMS)
+            classname = "tests.{team}.module_{mod}.TestClass{cls}".format(
+                team=team, mod=rnd.randint(0, 200), cls=rnd.randint(0, 20)
+            )
+            fd.write(
+                '  <testcase classname="{0}" name="test_{1}" time="{2:.3f}" file="tests/{3}/test_{1}.py">\n'.format(
+                    classname, i, rnd.random(), team
+                )
+            )
+            fd.write(
+                '    <properties><property name="polarion-id" value="RHEVM-{0}"/>'
+                '<property name="bz" value="{1}"/></properties>\n'.format(i, rnd.randint(1000000, 2000000))
+            )
+            roll = rnd.random()
+            if roll < failure_ratio:
+                fd.write('    <failure message="assert failed">Traceback of test_{0}\nAssertionError</failure>\n'.format(i))
+            elif roll < failure_ratio + skip_ratio:
+                fd.write('    <skipped message="not supported"/>\n')
+            fd.write('    <system_out>{0}</system_out>\n'.format(out))
+            fd.write('  </testcase>\n')
+        fd.write('</testsuite>\n')
@@ -1,17 +1,67 @@
 import sys
 import argparse
 import logging
-import yaml
 import requests
 import json
 import time
 import traceback
 import os
-import xmltodict
 import shutil
+import heapq
+import pickle
+import tempfile
+import glob
+import collections
+import collections.abc
+import itertools
+import uuid
+import zlib
+import zipfile
+import threading
+import contextlib
+import functools
+import hashlib
+import struct
+import email.utils
+import importlib
+import mmap
+import fnmatch
+import queue
+import select
+import signal
+import stat
+from concurrent.futures import ThreadPoolExecutor, Future
 from mimetypes import guess_type
 
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from reportportal_client import ReportPortalServiceAsync
+from reportportal_client.service import uri_join
+
+
+
+class _LazyModule(object):
+    """
+    Module imported when it is used for the first time, so every command imports only what it needs.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+yaml = _LazyModule('yaml')
+xmltodict = _LazyModule('xmltodict')
+etree = _LazyModule('lxml.etree')
+asyncio = _LazyModule('asyncio')
+multiprocessing = _LazyModule('multiprocessing')
+tarfile = _LazyModule('tarfile')
+futures_process = _LazyModule('concurrent.futures.process')
 
 # default log file name
 LOG_FILE_NAME = 'rp_cli.log'
@@ -26,7 +76,100 @@ LOG_LEVELS = {
 
 DEFAULT_LOG_LEVEL = "info"
 STRATEGIES = ["Rhv", "Raut", "Cfme", "Cnv"]
+# entry point group of the strategies provided by other packages
+STRATEGY_ENTRY_POINTS = 'rp_cli.strategies'
+# compiled test_owners of the configuration files are cached here, an empty RP_CLI_CACHE_DIR disables the cache
+CONFIG_CACHE_DIR = os.environ.get('RP_CLI_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'rp_cli'))
 DEFAULT_OUT_FILE = "rp_cli.json"
+# compressed xunit files are recognized by their first bytes
+XUNIT_MAGIC = [
+    (b'\x1f\x8b', 'gzip'),
+    (b'\xfd7zXZ\x00', 'xz'),
+    (b'BZh', 'bz2'),
+    (b'\x28\xb5\x2f\xfd', 'zstd'),
+]
+XUNIT_MAGIC_SIZE = max(len(magic) for magic, _ in XUNIT_MAGIC)
+# --parse_workers send the test cases in chunks, at most PARSE_QUEUE_CHUNKS of them wait per shard
+PARSE_CHUNK_SIZE = 1000
+PARSE_QUEUE_CHUNKS = 2
+# number of test cases sorted in memory before they are spilled to disk
+DEFAULT_SORT_BUFFER = 50000
+# system_out and failures longer than this are kept compressed until they are read
+PACK_THRESHOLD = 1024
+# log entries are sent in batches flushed at this count or size
+DEFAULT_LOG_BATCH_SIZE = 20
+DEFAULT_LOG_BATCH_BYTES = 8 * 1024 * 1024
+# --zipped logs archiving
+ARCHIVE_FORMATS = {'zip': '.zip', 'gztar': '.tar.gz', 'zstd': '.tar.zst'}
+DEFAULT_ARCHIVE_FORMAT = 'zip'
+DEFAULT_ARCHIVE_LEVEL = 6
+# valid compression levels of every archive format
+ARCHIVE_LEVELS = {'zip': (0, 9), 'gztar': (0, 9), 'zstd': (1, 22)}
+DEFAULT_ARCHIVE_WORKERS = 2
+# threads scanning the --test_logs tree, one top level directory each
+DEFAULT_LOG_INDEX_WORKERS = 4
+# retries and timeouts of the import/verify/update requests
+DEFAULT_HTTP_RETRIES = 5
+DEFAULT_HTTP_BACKOFF = 0.5
+DEFAULT_HTTP_CONNECT_TIMEOUT = 10
+DEFAULT_HTTP_READ_TIMEOUT = 300
+RETRY_STATUSES = (429, 502, 503, 504)
+# longer Retry-After pauses of the server are cut to this many seconds
+MAX_RETRY_AFTER = 60.0
+# the request was not processed by the server, it can be retried whatever its method is
+REFUSED_STATUSES = (429, 503)
+IDEMPOTENT_METHODS = frozenset(['GET', 'PUT', 'HEAD', 'OPTIONS', 'DELETE'])
+# adaptive rate control of the reporting requests
+MIN_RATE = 1.0
+RATE_INCREASE = 5.0
+# above RATE_INCREASE / RATE_RECOVERY requests/s the rate grows by this part of it per second
+RATE_RECOVERY = 0.1
+RATE_DECREASE = 0.5
+# part (and number) of the responses of the last second which have to show overload to lower the rate
+OVERLOAD_SHARE = 0.1
+OVERLOAD_MIN_RESPONSES = 2
+LATENCY_DECREASE = 0.8
+LATENCY_SPIKE_FACTOR = 4.0
+# smoothed latency below which the server is not considered overloaded
+LATENCY_FLOOR = 0.1
+# reporting engines
+ENGINES = ["thread", "asyncio"]
+DEFAULT_ENGINE = "thread"
+DEFAULT_CONNECTIONS = 8
+DEFAULT_MAX_IN_FLIGHT = 256
+# operations queued to a --folder_workers worker before the parser waits for it
+FOLDER_WORKER_QUEUE = 10000
+# a resumed --journal is searched backwards in blocks of this size for the end of its last complete line
+JOURNAL_READ_BLOCK = 64 * 1024
+# attachments are read and sent in chunks of this size
+ATTACHMENT_CHUNK_SIZE = 64 * 1024
+# --dedup_attachments: smaller files are always uploaded, the index keeps at most this many contents
+DEDUP_MIN_SIZE = 4096
+ATTACHMENT_INDEX_MAX_ENTRIES = 100000
+# --digest_dir: <launch id>.digest files, hash size of every test case
+DIGEST_SUFFIX = '.digest'
+DIGEST_HASH_SIZE = 8
+# --watch daemon: completed files are reported by the watcher, queued files per worker
+WATCH_PATTERNS = ['*.xml', '*.xml.gz', '*.xml.xz', '*.xml.bz2', '*.xml.zst']
+DEFAULT_WATCH_WORKERS = 2
+DEFAULT_WATCH_INTERVAL = 5.0
+WATCH_QUEUE = 2
+WATCH_TICK = 1.0
+INOTIFY_EVENT = struct.Struct('iIII')
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_TO = 0x80
+IN_Q_OVERFLOW = 0x4000
+# log messages bigger than these limits (per message, per test case) are cut or split, the rest is attached
+DEFAULT_MAX_MESSAGE_SIZE = 1024 * 1024
+DEFAULT_MAX_CASE_LOG_SIZE = 4 * 1024 * 1024
+OVERSIZE_MODES = ["attach", "split"]
+DEFAULT_OVERSIZE_MODE = "attach"
+# --spool directory layout: length-prefixed json records of the operations and attachments by content hash
+SPOOL_MAGIC = b'RPSPOOL1'
+SPOOL_RECORD_HEADER = struct.Struct('>I')
+SPOOL_OPS_FILE = 'ops.bin'
+SPOOL_BLOBS_DIR = 'blobs'
+SPOOL_OPERATIONS = ['start_launch', 'finish_launch', 'start_test_item', 'finish_test_item', 'log', 'log_file']
 
 logger = logging.getLogger("rp_cli.py")
 
@@ -35,6 +178,670 @@ def timestamp():
     return str(int(time.time() * 1000))
 
 
+def _element_to_dict(elem):
+    """
+    Converts lxml element into the structure xmltodict.parse() builds for it,
+    so the strategies get the same case data no matter how the xunit was parsed.
+
+    Args:
+        elem: lxml element
+
+    Returns: dict, or the stripped text (None if empty) for elements without attributes and children
+    """
+    result = dict(('@' + key, value) for key, value in elem.attrib.items())
+    texts = [elem.text] if elem.text else []
+
+    for child in elem:
+        if child.tail:
+            texts.append(child.tail)
+        # skip comments and processing instructions
+        if not isinstance(child.tag, str):
+            continue
+        value = _element_to_dict(child)
+        if child.tag not in result:
+            result[child.tag] = value
+        elif isinstance(result[child.tag], list):
+            result[child.tag].append(value)
+        else:
+            result[child.tag] = [result[child.tag], value]
+
+    text = ''.join(texts).strip()
+    if not result:
+        return text or None
+    if text:
+        result['#text'] = text
+    return result
+
+
+class _Packed(object):
+    """
+    Compressed pickle of a value kept for later.
+    """
+    __slots__ = ('data', )
+
+    def __init__(self, data):
+        self.data = data
+
+
+def _pack(value):
+    if value is None or isinstance(value, str) and len(value) < PACK_THRESHOLD:
+        return value
+    data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+    if len(data) < PACK_THRESHOLD:
+        return value
+    return _Packed(zlib.compress(data, 1))
+
+
+def _unpack(value):
+    if isinstance(value, _Packed):
+        return pickle.loads(zlib.decompress(value.data))
+    return value
+
+
+# elements of the testcase parsed into the TestCase fields
+_CASE_ATTRIBUTES = {'@name': 'name', '@classname': 'classname', '@file': 'file', '@time': 'time'}
+_CASE_PACKED = {'system_out': '_system_out', 'failure': '_failure', 'error': '_error'}
+
+
+class _Missing(object):
+    """
+    Marks an element absent from the testcase, it stays the same object when a TestCase is pickled.
+    """
+    __slots__ = ()
+
+    def __reduce__(self):
+        return '_MISSING'
+
+    def __repr__(self):
+        return '_MISSING'
+
+
+_MISSING = _Missing()
+
+
+class TestCase(collections.abc.Mapping):
+    """
+    Compact record of a xunit test case, built once per case.
+
+    The strategies read its fields: name, classname and team (interned), file, time,
+    properties as (name, value) pairs and status (PASSED, FAILED or SKIPPED). Long
+    system_out and failure texts are kept compressed until they are read.
+
+    It is also a read-only mapping with the keys and values xmltodict gives for the
+    testcase element ('@classname', 'properties', 'skipped', ...), so strategies
+    written against the dictionaries keep working.
+    """
+    __slots__ = (
+        'name', 'classname', 'team', 'file', 'time', 'properties', 'status',
+        '_system_out', '_failure', '_error', '_other',
+    )
+
+    def __init__(self, case):
+        """
+        Args:
+            case: testcase element as parsed by xmltodict
+        """
+        self.name = case.get('@name')
+        classname = case.get('@classname')
+        self.classname = sys.intern(classname) if classname is not None else None
+        parts = classname.split('.') if classname else []
+        self.team = sys.intern(parts[1]) if len(parts) > 1 else None
+        self.file = case.get('@file')
+        self.time = case.get('@time')
+
+        self.properties = None
+        if case.get('properties'):
+            properties = case['properties'].get('property') or []
+            if not isinstance(properties, list):
+                properties = [properties]
+            self.properties = tuple((p.get('@name'), p.get('@value')) for p in properties)
+
+        if 'skipped' in case:
+            self.status = 'SKIPPED'
+        elif case.get('failure') or case.get('error'):
+            self.status = 'FAILED'
+        else:
+            self.status = 'PASSED'
+
+        for key, slot in _CASE_PACKED.items():
+            setattr(self, slot, _pack(case[key]) if key in case else _MISSING)
+        self._other = dict(
+            (key, value) for key, value in case.items()
+            if key not in _CASE_ATTRIBUTES and key not in _CASE_PACKED and key != 'properties'
+        ) or None
+
+    @property
+    def system_out(self):
+        return self.get('system_out')
+
+    @property
+    def failure(self):
+        """
+        The failure element, or the error one if there is no failure.
+        """
+        if self._failure is not _MISSING:
+            return _unpack(self._failure)
+        return self.get('error')
+
+    @property
+    def skip_message(self):
+        skipped = self.get('skipped')
+        return skipped.get('@message') if isinstance(skipped, dict) else None
+
+    def __getitem__(self, key):
+        if key in _CASE_ATTRIBUTES:
+            value = getattr(self, _CASE_ATTRIBUTES[key])
+            if value is None:
+                raise KeyError(key)
+            return value
+
+        if key in _CASE_PACKED:
+            value = getattr(self, _CASE_PACKED[key])
+            if value is _MISSING:
+                raise KeyError(key)
+            return _unpack(value)
+
+        if key == 'properties':
+            if not self.properties:
+                raise KeyError(key)
+            properties = [{'@name': name, '@value': value} for name, value in self.properties]
+            # xmltodict gives a list only for repeated elements
+            return {'property': properties if len(properties) > 1 else properties[0]}
+
+        if self._other and key in self._other:
+            return self._other[key]
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        for key in itertools.chain(_CASE_ATTRIBUTES, ['properties'], _CASE_PACKED, self._other or ()):
+            if key in self:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return 'TestCase({0}.{1}, {2})'.format(self.classname, self.name, self.status)
+
+
+def _xunit_codec(head):
+    for magic, codec in XUNIT_MAGIC:
+        if head.startswith(magic):
+            return codec
+    return None
+
+
+def _decompressing_reader(codec, fd):
+    if codec == 'gzip':
+        import gzip
+        return gzip.GzipFile(fileobj=fd, mode='rb')
+    if codec == 'xz':
+        import lzma
+        return lzma.LZMAFile(fd, mode='rb')
+    if codec == 'bz2':
+        import bz2
+        return bz2.BZ2File(fd, mode='rb')
+    try:
+        import zstandard
+    except ImportError:
+        logger.error('%s is zstd compressed, install zstandard to read it: pip install zstandard', fd.name)
+        sys.exit(1)
+    return zstandard.ZstdDecompressor().stream_reader(fd)
+
+
+@contextlib.contextmanager
+def open_xunit(xunit_file):
+    """
+    Opens the xunit file for reading, gzip, xz, bz2 and zstd files (detected by their
+    magic bytes) are decompressed as they are read. Plain files are memory-mapped.
+
+    Yields: (binary file like object, codec or None)
+    """
+    with open(xunit_file, 'rb') as fd:
+        codec = _xunit_codec(fd.read(XUNIT_MAGIC_SIZE))
+        fd.seek(0)
+        if codec is not None:
+            with contextlib.closing(_decompressing_reader(codec, fd)) as stream:
+                yield stream, codec
+        elif os.fstat(fd.fileno()).st_size == 0:
+            # an empty file cannot be mapped
+            yield fd, None
+        else:
+            with mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                yield buffer, None
+
+
+def load_xunit_cases(xunit_file):
+    """
+    Parses the whole xunit file at once.
+
+    Returns: list of test cases
+    """
+    with open_xunit(xunit_file) as (stream, _):
+        data = xmltodict.parse(stream)
+
+    xml = data.get("testsuite").get("testcase")
+
+    # if there is only 1 test case, convert 'xml' from dict to list
+    # otherwise, 'xml' is always list
+    if not isinstance(xml, list):
+        xml = [xml]
+
+    # replace the parsed dictionaries one by one, so they are released as they are converted
+    for index, case in enumerate(xml):
+        xml[index] = TestCase(case)
+
+    return xml
+
+
+def iter_xunit_cases(xunit_file):
+    """
+    Parses the xunit file incrementally and yields one test case at a time.
+
+    Every testcase element is dropped from the tree as soon as it was converted,
+    so memory does not grow with the size of the file.
+    """
+    with open_xunit(xunit_file) as (stream, codec):
+        # lxml reads plain files by itself, faster than through a python file object
+        source = stream if codec is not None else xunit_file
+        for _, elem in etree.iterparse(source, events=('end',), tag='testcase', huge_tree=True):
+            case = TestCase(_element_to_dict(elem))
+            elem.clear()
+            # drop already processed siblings still referenced by the parent
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+            yield case
+
+
+class TestOwners(dict):
+    """
+    The test_owners mapping (owner -> list of class name patterns) compiled into
+    an Aho-Corasick automaton.
+
+    match() returns the same owner as scanning the owners and their patterns in order
+    and taking the first pattern contained in the class name. Results are memoized
+    per class name.
+    """
+
+    def __init__(self, test_owners=None):
+        super(TestOwners, self).__init__(test_owners or {})
+        # trie transitions, failure links and the best (lowest) pattern rank reachable from every node
+        self._goto = [{}]
+        self._fail = [0]
+        self._rank = [None]
+        self._owners = []
+        self._cache = {}
+
+        for owner, patterns in self.items():
+            for pattern in patterns or []:
+                self._add_pattern(pattern, len(self._owners))
+                self._owners.append(owner)
+        self._build_failure_links()
+
+    def _add_pattern(self, pattern, rank):
+        node = 0
+        for char in pattern:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._rank.append(None)
+            node = next_node
+        if self._rank[node] is None:
+            self._rank[node] = rank
+
+    def _build_failure_links(self):
+        queue = collections.deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                queue.append(child)
+            # a node also matches everything its failure link matches
+            fail_rank = self._rank[self._fail[node]]
+            if fail_rank is not None and (self._rank[node] is None or fail_rank < self._rank[node]):
+                self._rank[node] = fail_rank
+
+    def match(self, classname):
+        """
+        Returns: owner of the first pattern found in classname, None if there is none
+        """
+        if classname in self._cache:
+            return self._cache[classname]
+
+        goto, fail, ranks = self._goto, self._fail, self._rank
+        best = ranks[0]  # an empty pattern matches everything
+        node = 0
+        for char in classname:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            rank = ranks[node]
+            if rank is not None and (best is None or rank < best):
+                best = rank
+
+        owner = self._owners[best] if best is not None else None
+        self._cache[classname] = owner
+        return owner
+
+
+@contextlib.contextmanager
+def _no_phase(name):
+    yield
+
+
+class Metrics(object):
+    """
+    Phase timers and HTTP request statistics of one rp_cli run.
+
+    Phases are timed exclusively: time spent in a phase nested into another one
+    (e.g. the strategy hooks called while parsing) is not counted for the outer phase.
+    Requests are grouped by endpoint (method and URL path with the ids left out).
+    """
+
+    LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    URL_WORDS = ('launch', 'item', 'log', 'import', 'finish', 'stop', 'update')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.started = time.time()
+        # phase name -> [seconds, count]
+        self.phases = collections.OrderedDict()
+        # endpoint -> counters
+        self.requests = collections.OrderedDict()
+
+    def _stack(self):
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        return self.local.stack
+
+    def _add_phase_time(self, name, seconds, count=0):
+        with self.lock:
+            phase = self.phases.setdefault(name, [0.0, 0])
+            phase[0] += seconds
+            phase[1] += count
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        stack = self._stack()
+        now = time.time()
+        if stack:
+            # pause the outer phase
+            self._add_phase_time(stack[-1][0], now - stack[-1][1])
+        stack.append([name, now])
+        try:
+            yield
+        finally:
+            now = time.time()
+            name, start = stack.pop()
+            self._add_phase_time(name, now - start, 1)
+            if stack:
+                stack[-1][1] = now
+
+    def timed(self, name, iterable):
+        """
+        Times getting every item of the iterable as the phase.
+        """
+        iterator = iter(iterable)
+        while True:
+            with self.phase(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    @classmethod
+    def endpoint(cls, method, url):
+        path = url.split('?')[0].split('/api/v1/', 1)[-1].split('/')[1:]
+        return '{0} {1}'.format(method, '/'.join(part if part in cls.URL_WORDS else '{id}' for part in path if part))
+
+    def observe(self, endpoint, latency, failed=False, bytes_sent=0, bytes_received=0, retries=0):
+        with self.lock:
+            stats = self.requests.get(endpoint)
+            if stats is None:
+                stats = self.requests[endpoint] = {
+                    'count': 0, 'errors': 0, 'latency_sum': 0.0, 'latency_max': 0.0,
+                    'buckets': [0] * len(self.LATENCY_BUCKETS), 'bytes_sent': 0, 'bytes_received': 0,
+                    'retries': 0,
+                }
+            stats['count'] += 1
+            stats['retries'] += retries
+            stats['errors'] += int(failed)
+            stats['latency_sum'] += latency
+            stats['latency_max'] = max(stats['latency_max'], latency)
+            stats['bytes_sent'] += bytes_sent
+            stats['bytes_received'] += bytes_received
+            for i, bound in enumerate(self.LATENCY_BUCKETS):
+                if latency <= bound:
+                    stats['buckets'][i] += 1
+
+    def observe_response(self, response, *args, **kwargs):
+        """
+        requests response hook.
+        """
+        body = response.request.body
+        if isinstance(body, (bytes, str)):
+            bytes_sent = len(body)
+        else:
+            # streamed bodies count what they have sent
+            bytes_sent = getattr(body, 'bytes_sent', 0)
+        self.observe(
+            self.endpoint(response.request.method, response.request.url),
+            response.elapsed.total_seconds(),
+            failed=response.status_code >= 400,
+            bytes_sent=bytes_sent,
+            bytes_received=len(response.content or b''),
+            retries=self.retries(response),
+        )
+        return response
+
+    @staticmethod
+    def retries(response):
+        retry = getattr(response.raw, 'retries', None)
+        retries = len(retry.history) if retry is not None else 0
+        # retried by the RateLimitedAdapter
+        return retries + getattr(response, 'rp_cli_retries', 0)
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                'wall_seconds': round(time.time() - self.started, 3),
+                'phases': dict(
+                    (name, {'seconds': round(seconds, 3), 'count': count})
+                    for name, (seconds, count) in self.phases.items()
+                ),
+                'requests': dict(
+                    (endpoint, dict(
+                        stats,
+                        latency_sum=round(stats['latency_sum'], 3),
+                        buckets=dict(zip([str(bound) for bound in self.LATENCY_BUCKETS], stats['buckets'])),
+                    ))
+                    for endpoint, stats in self.requests.items()
+                ),
+            }
+
+    def write_prometheus(self, dest):
+        """
+        Writes the metrics in the Prometheus text format (node exporter textfile collector).
+        """
+        data = self.as_dict()
+        lines = [
+            '# HELP rp_cli_wall_seconds Duration of the rp_cli run.',
+            '# TYPE rp_cli_wall_seconds gauge',
+            'rp_cli_wall_seconds {0}'.format(data['wall_seconds']),
+            '# HELP rp_cli_phase_seconds Time spent in rp_cli phases.',
+            '# TYPE rp_cli_phase_seconds gauge',
+        ]
+        for name, phase in data['phases'].items():
+            lines.append('rp_cli_phase_seconds{{phase="{0}"}} {1}'.format(name, phase['seconds']))
+
+        lines.extend([
+            '# HELP rp_cli_http_request_duration_seconds Latency of report portal requests.',
+            '# TYPE rp_cli_http_request_duration_seconds histogram',
+        ])
+        for endpoint, stats in data['requests'].items():
+            for bound in self.LATENCY_BUCKETS:
+                lines.append('rp_cli_http_request_duration_seconds_bucket{{endpoint="{0}",le="{1}"}} {2}'.format(
+                    endpoint, bound, stats['buckets'][str(bound)]))
+            lines.append('rp_cli_http_request_duration_seconds_bucket{{endpoint="{0}",le="+Inf"}} {1}'.format(
+                endpoint, stats['count']))
+            lines.append('rp_cli_http_request_duration_seconds_sum{{endpoint="{0}"}} {1}'.format(
+                endpoint, stats['latency_sum']))
+            lines.append('rp_cli_http_request_duration_seconds_count{{endpoint="{0}"}} {1}'.format(
+                endpoint, stats['count']))
+
+        for metric, key, help_text in (
+            ('rp_cli_http_request_errors_total', 'errors', 'Failed report portal requests.'),
+            ('rp_cli_http_request_retries_total', 'retries', 'Retried report portal requests.'),
+            ('rp_cli_http_sent_bytes_total', 'bytes_sent', 'Bytes sent to report portal.'),
+            ('rp_cli_http_received_bytes_total', 'bytes_received', 'Bytes received from report portal.'),
+        ):
+            lines.extend(['# HELP {0} {1}'.format(metric, help_text), '# TYPE {0} counter'.format(metric)])
+            for endpoint, stats in data['requests'].items():
+                lines.append('{0}{{endpoint="{1}"}} {2}'.format(metric, endpoint, stats[key]))
+
+        # write and rename, so the collector never reads a partial file
+        tmp_dest = dest + '.tmp'
+        with open(tmp_dest, 'w') as fh:
+            fh.write('\n'.join(lines) + '\n')
+        os.rename(tmp_dest, dest)
+
+
+# key identifies the test case in the --journal, None when not journaling
+PreparedCase = collections.namedtuple('PreparedCase', ['case', 'name', 'description', 'tags', 'key'])
+
+
+def expand_xunit_feed(xunit_feed):
+    """
+    Expands the xunit file paths and glob patterns.
+
+    Returns: list of xunit files
+    """
+    if isinstance(xunit_feed, str):
+        xunit_feed = [xunit_feed]
+
+    xunit_files = []
+    for pattern in xunit_feed:
+        # keep the pattern when nothing matches, so opening it reports a clear error
+        xunit_files.extend(sorted(glob.glob(pattern)) or [pattern])
+    return xunit_files
+
+
+def parse_xunit(xunit_file, streaming=False):
+    if streaming:
+        return iter_xunit_cases(xunit_file)
+    return load_xunit_cases(xunit_file)
+
+
+def prepare_cases(strategy, cases, test_owners, metrics=None):
+    """
+    Computes the name, description and tags of every test case.
+
+    Returns: generator of PreparedCase
+    """
+    phase = metrics.phase if metrics is not None else _no_phase
+    for case in cases:
+        with phase('strategy'):
+            prepared = PreparedCase(
+                case=case,
+                name=strategy.get_testcase_name(case),
+                description=strategy.get_testcase_description(case),
+                tags=strategy.get_tags(case, test_owners=test_owners),
+                key=None,
+            )
+        yield prepared
+
+
+def _prepare_shard(xunit_file, strategy, test_owners, streaming, chunks):
+    """
+    Runs in the parser pool: parses one xunit shard and sends its prepared test cases
+    to the chunks queue, PARSE_CHUNK_SIZE at a time, None ends them.
+
+    Returns: number of test cases
+    """
+    count = 0
+    chunk = []
+    for prepared in prepare_cases(strategy, parse_xunit(xunit_file, streaming), test_owners):
+        chunk.append(prepared)
+        if len(chunk) >= PARSE_CHUNK_SIZE:
+            # blocks while the reporting is behind
+            chunks.put(chunk)
+            count += len(chunk)
+            chunk = []
+    chunks.put(chunk)
+    chunks.put(None)
+    return count + len(chunk)
+
+
+def _spill_run(items):
+    run = tempfile.TemporaryFile()
+    for item in items:
+        pickle.dump(item, run, pickle.HIGHEST_PROTOCOL)
+    run.seek(0)
+    return run
+
+
+def _read_run(run):
+    while True:
+        try:
+            yield pickle.load(run)
+        except EOFError:
+            return
+
+
+def external_sort(items, key, buffer_size=DEFAULT_SORT_BUFFER):
+    """
+    Sorts the items with bounded memory.
+
+    Chunks of buffer_size items are sorted in memory and spilled into temporary files,
+    which are lazily merged afterwards. The sort is stable like sorted().
+
+    Args:
+        items: iterable to sort
+        key: sort key function
+        buffer_size: maximal number of items held in memory
+
+    Returns: generator of sorted items
+    """
+    runs = []
+    chunk = []
+    try:
+        for item in items:
+            chunk.append(item)
+            if len(chunk) >= buffer_size:
+                runs.append(_spill_run(sorted(chunk, key=key)))
+                chunk = []
+        chunk.sort(key=key)
+
+        # everything fits into memory, no need to merge
+        if not runs:
+            for item in chunk:
+                yield item
+            return
+
+        runs.append(_spill_run(chunk))
+        chunk = []
+        for item in heapq.merge(*[_read_run(run) for run in runs], key=key):
+            yield item
+    finally:
+        for run in runs:
+            run.close()
+
+
 def init_logger(level, filename=LOG_FILE_NAME):
     handler = logging.FileHandler(filename)
     formatter = logging.Formatter(
@@ -98,7 +905,7 @@ class Rhv(Strategy):
 
     def extract_failure_msg_from_xunit(self, case):
         text = ""
-        data = case.get('failure', case.get('error'))
+        data = case.failure
         if isinstance(data, list):
             for err in data:
                 text += '{txt}\n'.format(txt=err.get('#text').encode('ascii', 'ignore'))
@@ -106,42 +913,38 @@ class Rhv(Strategy):
         return data.get('#text')
 
     def get_logs_per_test_path(self, case):
-        name = case.get('@classname') + '.' + case.get('@name')
+        name = case.classname + '.' + case.name
         return '/'.join(name.split('.')[1:])
 
     def get_testcase_name(self, case):
-        return"{class_name}.{tc_name}".format(class_name=case.get('@classname'), tc_name=case.get('@name'))
+        return"{class_name}.{tc_name}".format(class_name=case.classname, tc_name=case.name)
 
     def get_testcase_description(self, case):
-        return "{tc_name} time: {case_time}".format(tc_name=case.get('@name'), case_time=case.get('@time'))
+        return "{tc_name} time: {case_time}".format(tc_name=case.name, case_time=case.time)
 
     def _get_team_name(self, case):
-        return case.get('@classname').split('.')[1]
+        return case.team
 
     def _get_properties(self, case):
         tags = list()
 
-        if 'properties' in case.keys():
-            properties = case.get('properties').get('property')
-
-            if not isinstance(properties, list):
-                properties = [properties]
-
-            for p in properties:
-                tags.append(
-                    '{key}:{value}'.format(
-                        key=p.get('@name'),
-                        value=p.get('@value'),
-                    )
+        for name, value in case.properties or ():
+            tags.append(
+                '{key}:{value}'.format(
+                    key=name,
+                    value=value,
                 )
+            )
 
         return tags
 
     def _get_test_owner(self, case, test_owners={}):
+        if isinstance(test_owners, TestOwners):
+            return test_owners.match(case.classname)
 
         for owner in test_owners.keys():
             for test in test_owners.get(owner):
-                if test in case.get('@classname'):
+                if test in case.classname:
                     return owner
         return
 
@@ -162,8 +965,9 @@ class Rhv(Strategy):
         return True
 
     def create_folder(self, case):
-        if self.current_team != self._get_team_name(case):
-            self.current_team = self._get_team_name(case)
+        team = self._get_team_name(case)
+        if self.current_team != team:
+            self.current_team = team
             return True, self.current_team
 
         return False, self.current_team
@@ -208,7 +1012,7 @@ class Cfme(Rhv):
     @staticmethod
     def get_testcase_name(case):
         """Example: cfme/tests/test_rest.py::test_product_info[rhv_cfme_integration]"""
-        file, classname, name = case.get("@file"), case.get("@classname").split(".")[-1], case.get("@name")
+        file, classname, name = case.file, case.classname.split(".")[-1], case.name
         # If a test case is encapsulated in pytest class, include the class in test case signature
         if classname.startswith('Test'):
             return "{}::{}::{}".format(file, classname, name)
@@ -218,8 +1022,8 @@ class Cfme(Rhv):
     @staticmethod
     def get_testcase_description(case):
         """Include info on skip reason and time it took to execute."""
-        skip_msg = '\n' + case.get('skipped').get('@message') if case.get('skipped') else 'No skip message found on xunit'
-        return "Time: {}{}".format(case.get('@time'), skip_msg)
+        skip_msg = '\n' + case.skip_message if case.skip_message else 'No skip message found on xunit'
+        return "Time: {}{}".format(case.time, skip_msg)
 
     def get_tags(self, case, test_owners={}):
         """Only get values of properties we are explicitly interested in."""
@@ -228,13 +1032,9 @@ class Cfme(Rhv):
 
         tags = []
 
-        if 'properties' in case.keys():
-            properties = case.get('properties').get('property')
-            if not isinstance(properties, list):
-                properties = [properties]
-            for p in properties:
-                if p.get("@name") in self.properties_to_parse:
-                    tags.append(p.get("@value"))
+        for name, value in case.properties or ():
+            if name in self.properties_to_parse:
+                tags.append(value)
 
         return tags
 
@@ -259,140 +1059,2210 @@ class Cnv(Rhv):
 # END: Class Cnv
 
 
-class RpManager:
-    def __init__(self, config, strategy):
-        self.url = config.get('rp_endpoint')
-        self.uuid = config.get('rp_uuid')
-        self.project = config.get('rp_project')
-        self.launch_description = config.get('launch_description')
-        self.launch_tags = config.get('launch_tags').split()
-        self.upload_xunit = config.get('upload_xunit')
-        self.update_headers = {
-            'Authorization': 'bearer %s' % self.uuid,
-            'Accept': 'application/json',
-            'Cache-Control': 'no-cache',
-            'content-type': 'application/json',
-        }
-        self.import_headers = {
-            'Authorization': 'bearer %s' % self.uuid,
-            'Accept': 'application/json',
-            'Cache-Control': 'no-cache',
-        }
-        self.launch_url = "{url}/api/v1/{project_name}/launch/%s".format(
-            url=self.url, project_name=self.project
-        )
-        self.launch_public_url = "{url}/ui/#{project_name}/launches/all/%s".format(
-            url=self.url, project_name=self.project
-        )
-        self.launch_id = ''
-        self.xunit_feed = config.get('xunit_feed')
-        self.launch_name = config.get('launch_name', 'rp_cli-launch')
-        self.strategy = strategy
-        self.service = ReportPortalServiceAsync(
-            endpoint=self.url, project=self.project, token=self.uuid, error_handler=self.strategy.my_error_handler
-        )
-        self.test_logs = config.get('test_logs')
-        self.zipped = config.get('zipped')
-        self.test_owners = config.get('test_owners', {})
-        self.strategy = strategy
+def load_strategy(name):
+    """
+    Finds the strategy class by its name: one of STRATEGIES or a class registered
+    in the rp_cli.strategies entry point group of an installed package, which is
+    imported only when it is asked for.
 
-    @staticmethod
-    def _check_return_code(req):
-        if req.status_code != 200:
-            logger.error('Something went wrong status code is %s; MSG: %s', req.status_code, req.json()['message'])
-            sys.exit(1)
+    Returns: strategy class, None if there is none of that name
+    """
+    if name in STRATEGIES:
+        return globals()[name]
 
-    def _import_results(self):
-        with open(self.upload_xunit, 'rb') as xunit_file:
-            files = {'file': xunit_file}
-            req = requests.post(self.launch_url % "import", headers=self.import_headers, files=files)
+    from importlib import metadata
+    entry_points = metadata.entry_points()
+    if hasattr(entry_points, 'select'):
+        entry_points = entry_points.select(group=STRATEGY_ENTRY_POINTS)
+    else:
+        entry_points = entry_points.get(STRATEGY_ENTRY_POINTS, [])
+    for entry_point in entry_points:
+        if entry_point.name == name:
+            return entry_point.load()
+    return None
 
-        response = req.json()
-        self._check_return_code(req)
-        logger.info("Import is done successfully")
-        response_msg = response['msg'].encode('ascii', 'ignore')
-        logger.info('Status code: %s; %s', req.status_code, response_msg)
 
-        # returning the launch_id
-        return response_msg.split()[4]
+class MultipartStream(object):
+    """
+    multipart/form-data body generated chunk by chunk while it is being sent.
 
-    def _verify_upload_succeeded(self, launch_id):
-        launch_id_url = self.launch_url % launch_id
-        req = requests.get(launch_id_url, headers=self.update_headers)
-        self._check_return_code(req)
-        logger.info('Launch have been created successfully')
-        return True
+    Args:
+        parts: list of (field name, file name or None, content type, list of byte chunks
+               or function returning an iterable of byte chunks)
+    """
 
-    def _update_launch_description_and_tags(self, launch_id):
-        update_url = self.launch_url % launch_id + "/update"
+    def __init__(self, parts):
+        self.parts = parts
+        self.boundary = uuid.uuid4().hex
+        self.content_type = 'multipart/form-data; boundary={0}'.format(self.boundary)
+        self.bytes_sent = 0
 
-        data = {
-            "description": self.launch_description,
-            "tags": self.launch_tags
-        }
+    @property
+    def replayable(self):
+        """
+        True if the body can be sent again, i.e. no part is a one-shot iterator.
+        """
+        return all(callable(chunks) or isinstance(chunks, (list, tuple)) for _, _, _, chunks in self.parts)
 
-        req = requests.put(url=update_url, headers=self.update_headers, data=json.dumps(data))
-        self._check_return_code(req)
-        logger.info(
-            'Launch description %s and tags %s where updated for launch id %s',
-            self.launch_description, self.launch_tags, launch_id
-        )
+    def _iter_chunks(self):
+        for field, file_name, content_type, chunks in self.parts:
+            if callable(chunks):
+                chunks = chunks()
+            disposition = 'form-data; name="{0}"'.format(field)
+            if file_name is not None:
+                disposition += '; filename="{0}"'.format(file_name.replace('"', '\\"'))
+            yield '--{0}\r\nContent-Disposition: {1}\r\nContent-Type: {2}\r\n\r\n'.format(
+                self.boundary, disposition, content_type).encode('utf-8')
+            for chunk in chunks:
+                if chunk:
+                    yield chunk
+            yield b'\r\n'
+        yield '--{0}--\r\n'.format(self.boundary).encode('utf-8')
 
-    def import_results(self):
-        self.launch_id = self._import_results()
-        self._verify_upload_succeeded(self.launch_id)
-        self._update_launch_description_and_tags(self.launch_id)
+    def __iter__(self):
+        self.bytes_sent = 0
+        for chunk in self._iter_chunks():
+            self.bytes_sent += len(chunk)
+            yield chunk
 
-    def _start_launch(self):
-        return self.service.start_launch(
-            name=self.launch_name, start_time=timestamp(), description=self.launch_description, tags=self.launch_tags)
+
+def iter_file_chunks(path, max_size=None, chunk_size=ATTACHMENT_CHUNK_SIZE):
+    """
+    Reads the file chunk by chunk.
+
+    Files bigger than max_size are truncated: the head and the tail (max_size / 2 each)
+    are kept and a note about the skipped part is put in between.
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as fh:
+        if max_size is None or size <= max_size:
+            head, tail = size, 0
+        else:
+            head = max_size // 2
+            tail = max_size - head
+
+        left = head
+        while left > 0:
+            chunk = fh.read(min(chunk_size, left))
+            if not chunk:
+                break
+            left -= len(chunk)
+            yield chunk
+
+        if tail:
+            yield '\n\n... [{0} bytes truncated by rp_cli] ...\n\n'.format(size - head - tail).encode('utf-8')
+            fh.seek(size - tail)
+            while True:
+                chunk = fh.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+
+class _BufferWriter(object):
+    """
+    Write-only unseekable file collecting the written data until it is drained.
+    """
+
+    def __init__(self):
+        self.buffer = []
+
+    def write(self, data):
+        self.buffer.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.buffer)
+        self.buffer = []
+        return data
+
+
+def iter_zipped(files, chunk_size=ATTACHMENT_CHUNK_SIZE):
+    """
+    Zips the files on the fly.
+
+    Args:
+        files: list of (path, name in the archive)
+
+    Returns: generator of the zip archive chunks
+    """
+    buffer = _BufferWriter()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for path, arcname in files:
+            info = zipfile.ZipInfo.from_file(path, arcname)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            # the local header can not be rewritten in an unseekable stream
+            force_zip64 = info.file_size > zipfile.ZIP64_LIMIT
+            with open(path, 'rb') as src, archive.open(info, 'w', force_zip64=force_zip64) as dest:
+                while True:
+                    chunk = src.read(chunk_size)
+                    if not chunk:
+                        break
+                    dest.write(chunk)
+                    yield buffer.drain()
+            yield buffer.drain()
+    # central directory
+    yield buffer.drain()
+
+
+def gzip_chunks(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        yield compressor.compress(chunk)
+    yield compressor.flush()
+
+
+class MessageBudget(object):
+    """
+    Limits the size of the log messages sent inline, per message and per test case.
+
+    A message over the limit is cut to its head and tail (attach mode) or split into
+    ordered parts (split mode). Whatever does not fit inline is attached as a whole.
+    """
+
+    def __init__(self, max_message_size=None, max_case_size=None, split=False):
+        self.max_message_size = max_message_size
+        self.max_case_size = max_case_size
+        self.split = split
+        self.case_size = 0
+
+    def start_case(self):
+        self.case_size = 0
+
+    def _remaining(self):
+        if self.max_case_size is None:
+            return None
+        return max(0, self.max_case_size - self.case_size)
+
+    @staticmethod
+    def _split(data, part_size):
+        """
+        Returns: parts of the UTF-8 data of at most part_size bytes, cut between the characters
+        """
+        parts = []
+        start = 0
+        while start < len(data):
+            end = min(start + part_size, len(data))
+            # continuation bytes are 10xxxxxx, the cut moves back to the first byte of the character
+            while start < end < len(data) and data[end] & 0xC0 == 0x80:
+                end -= 1
+            if end == start:
+                # a character bigger than part_size is sent whole
+                end += 1
+                while end < len(data) and data[end] & 0xC0 == 0x80:
+                    end += 1
+            parts.append(data[start:end])
+            start = end
+        return parts
+
+    def plan(self, message):
+        """
+        Returns: (messages to send inline, True if the whole message has to be attached as well)
+        """
+        data = message.encode('utf-8')
+        size = len(data)
+        remaining = self._remaining()
+        limits = [limit for limit in (self.max_message_size, remaining) if limit is not None]
+        if not limits or size <= min(limits):
+            self.case_size += size
+            return [message], False
+
+        if self.split and self.max_message_size:
+            parts = self._split(data, self.max_message_size)
+            messages = []
+            for number, part in enumerate(parts, 1):
+                if remaining is not None and len(part) > remaining:
+                    break
+                if remaining is not None:
+                    remaining -= len(part)
+                self.case_size += len(part)
+                messages.append('[{0}/{1}] {2}'.format(number, len(parts), part.decode('utf-8')))
+            if len(messages) == len(parts):
+                return messages, False
+            messages.append('the log size limit of the test case was reached, {0} bytes are attached'.format(size))
+            return messages, True
+
+        keep = min(limits)
+        head = data[:keep // 2].decode('utf-8', 'ignore')
+        tail = data[size - keep // 2:].decode('utf-8', 'ignore') if keep > 1 else ''
+        self.case_size += keep
+        return ['{0}\n... {1} bytes cut, the whole message is attached ...\n{2}'.format(head, size - keep, tail)], True
+
+
+class LogIndex(object):
+    """
+    Index of the test logs tree, built once with os.scandir.
+
+    The top level directories are scanned in parallel by a thread pool, then all the lookups
+    of the test cases logs are answered from memory. A looked up directory which is not in the
+    index, a symlink to a directory or one created afterwards, is scanned when it is looked up.
+    The looked up paths are remembered, so the directories no test case asked for can be reported.
+    """
+
+    def __init__(self, root, workers=DEFAULT_LOG_INDEX_WORKERS):
+        self.root = root
+        # relative directory path -> (file names, sub directory names)
+        self.dirs = {}
+        self.requested = set()
+
+        top_level = self._scan_dir('')
+        if top_level is None:
+            logger.warning("Path (%s) with log files does not exist!" % (root, ))
+            return
+        self.dirs[''] = top_level
+
+        subdirs = top_level[1]
+        if workers > 1 and len(subdirs) > 1:
+            pool = ThreadPoolExecutor(max_workers=workers)
+            try:
+                for tree in pool.map(self._scan_tree, subdirs):
+                    self.dirs.update(tree)
+            finally:
+                pool.shutdown(wait=True)
+        else:
+            for subdir in subdirs:
+                self.dirs.update(self._scan_tree(subdir))
+        logger.info("Indexed %s directories of test logs in %s", len(self.dirs), root)
+
+    def _scan_dir(self, rel_path):
+        files, subdirs = [], []
+        try:
+            entries = list(os.scandir(os.path.join(self.root, rel_path)))
+        except OSError:
+            return None
+        for entry in entries:
+            # like os.walk, symlinks to directories are not followed
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.name)
+            elif not entry.is_dir():
+                files.append(entry.name)
+        return files, subdirs
+
+    def _scan_tree(self, rel_path):
+        tree = {}
+        stack = [rel_path]
+        while stack:
+            current = stack.pop()
+            content = self._scan_dir(current)
+            if content is None:
+                continue
+            tree[current] = content
+            stack.extend(os.path.join(current, subdir) for subdir in content[1])
+        return tree
+
+    @staticmethod
+    def _key(rel_path):
+        key = os.path.normpath(rel_path)
+        return '' if key == '.' else key
+
+    def files(self, rel_path):
+        """
+        Returns: full paths of all the files under rel_path (os.walk order), None if it does not exist
+        """
+        key = self._key(rel_path)
+        self.requested.add(key)
+        if key not in self.dirs:
+            # scandir follows the symlink of the looked up directory, the files keep its path
+            if not os.path.isdir(os.path.join(self.root, key)):
+                return None
+            self.dirs.update(self._scan_tree(key))
+
+        files = []
+        stack = [key]
+        while stack:
+            current = stack.pop()
+            log_files, subdirs = self.dirs[current]
+            files.extend(os.path.join(self.root, current, log_file) for log_file in log_files)
+            stack.extend(os.path.join(current, subdir) for subdir in reversed(subdirs))
+        return files
+
+    def orphans(self):
+        """
+        Returns: directories with log files which are not under any looked up path
+        """
+        orphans = []
+        for key, (log_files, _) in self.dirs.items():
+            if not log_files:
+                continue
+            parts = key.split(os.sep) if key else []
+            if not any(os.sep.join(parts[:i]) in self.requested for i in range(len(parts) + 1)):
+                orphans.append(key or '.')
+        return sorted(orphans)
+
+
+def make_archive(base_name, root_dir, archive_format=DEFAULT_ARCHIVE_FORMAT, level=DEFAULT_ARCHIVE_LEVEL, files=None):
+    """
+    Archives the content of root_dir.
+
+    Args:
+        base_name: archive path without the extension
+        root_dir: directory to archive
+        archive_format: one of ARCHIVE_FORMATS, 'zstd' needs the zstandard module
+        level: compression level
+        files: files under root_dir to archive (default: all of them)
+
+    Returns: path of the archive
+    """
+    path = base_name + ARCHIVE_FORMATS[archive_format]
+    if files is None:
+        files = [os.path.join(root, log_file) for root, dirs, log_files in os.walk(root_dir) for log_file in log_files]
+
+    if archive_format == 'zip':
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED, compresslevel=level) as archive:
+            for file_name in files:
+                archive.write(file_name, os.path.relpath(file_name, root_dir))
+    elif archive_format == 'gztar':
+        with tarfile.open(path, 'w:gz', compresslevel=level) as archive:
+            for file_name in files:
+                archive.add(file_name, arcname=os.path.relpath(file_name, root_dir))
+    else:
+        import zstandard
+        with open(path, 'wb') as fh:
+            with zstandard.ZstdCompressor(level=level).stream_writer(fh) as writer:
+                with tarfile.open(fileobj=writer, mode='w|') as archive:
+                    for file_name in files:
+                        archive.add(file_name, arcname=os.path.relpath(file_name, root_dir))
+
+    return path
+
+
+class ArchivePipeline(object):
+    """
+    Builds the log archives of the failed test cases in a thread pool.
+
+    prefetch() starts archiving the logs of the test cases before they are reported,
+    so the next archives are compressed while the previous ones are uploaded.
+    The archives are kept in a private temp directory and at most max_pending of them
+    exist at the same time, release() has to be called once an archive was uploaded.
+    """
+
+    def __init__(self, workers=DEFAULT_ARCHIVE_WORKERS, archive_format=DEFAULT_ARCHIVE_FORMAT,
+                 level=DEFAULT_ARCHIVE_LEVEL, tmp_dir=None, senders=1):
+        self.archive_format = archive_format
+        self.level = level
+        self.window = workers * 2
+        # archives in the prefetch window plus the ones waiting for upload by each of the senders
+        self.max_pending = self.window * (1 + senders)
+        self.slots = threading.BoundedSemaphore(self.max_pending)
+        self.tmp_dir = tempfile.mkdtemp(prefix='rp_cli-', dir=tmp_dir)
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.pending = {}
+        self.counter = itertools.count()
+
+    def _build(self, name, path, files):
+        if files is None:
+            try:
+                files = os.listdir(path)
+            except OSError:
+                return None, "Path (%s) with log files does not exist!" % (path, )
+            files = None if files else []
+        # check if there is something to zip
+        if files == []:
+            return None, "There are no logs on the path (%s)!" % (path, )
+
+        archive_dir = os.path.join(self.tmp_dir, str(next(self.counter)))
+        os.mkdir(archive_dir)
+        return make_archive(os.path.join(archive_dir, name), path, self.archive_format, self.level, files), None
+
+    def submit(self, key, name, path, files=None):
+        """
+        Starts archiving the path, blocks while there are max_pending archives.
+
+        Args:
+            files: files under the path to archive, when already known
+        """
+        self.slots.acquire()
+        self.pending[key] = self.pool.submit(self._build, name, path, files)
+
+    def is_pending(self, key):
+        return key in self.pending
+
+    def result(self, key):
+        """
+        Waits for the archive.
+
+        Returns: path of the archive, None if there was nothing to archive
+        """
+        try:
+            archive, warning = self.pending.pop(key).result()
+        except Exception:
+            self.release()
+            raise
+        if archive is None:
+            logger.warning(warning)
+            self.release()
+        return archive
+
+    def release(self):
+        self.slots.release()
+
+    def prefetch(self, items, get_logs):
+        """
+        Yields the items back, archiving the logs of the upcoming ones in the meantime.
+
+        Args:
+            items: iterable of items to report
+            get_logs: function returning submit() arguments for an item or None
+        """
+        window = collections.deque()
+        for item in items:
+            logs = get_logs(item)
+            if logs:
+                self.submit(*logs)
+            window.append(item)
+            if len(window) > self.window:
+                yield window.popleft()
+        while window:
+            yield window.popleft()
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+class CappedRetry(Retry):
+    """
+    Retry waiting at most MAX_RETRY_AFTER seconds when the server sends Retry-After.
+    """
+
+    def get_retry_after(self, response):
+        seconds = super(CappedRetry, self).get_retry_after(response)
+        return None if seconds is None else min(seconds, MAX_RETRY_AFTER)
+
+
+def create_http_session(retries=DEFAULT_HTTP_RETRIES, backoff=DEFAULT_HTTP_BACKOFF, pool_size=DEFAULT_CONNECTIONS,
+                        rate_controller=None):
+    """
+    Creates keep-alive session with a connection pool, paced by the rate_controller if any.
+
+    Idempotent requests are retried with exponential backoff on connection errors and on
+    RETRY_STATUSES responses (honoring Retry-After), the other ones only when the connection
+    could not be established, i.e. nothing was sent yet.
+    """
+    retry_kwargs = dict(
+        total=retries, connect=retries, read=retries, status=retries, backoff_factor=backoff,
+        status_forcelist=RETRY_STATUSES, raise_on_status=False, respect_retry_after_header=True,
+    )
+    try:
+        retry = CappedRetry(allowed_methods=IDEMPOTENT_METHODS, **retry_kwargs)
+    except TypeError:
+        # urllib3 < 1.26
+        retry = CappedRetry(method_whitelist=IDEMPOTENT_METHODS, **retry_kwargs)
+
+    session = requests.Session()
+    if rate_controller is not None:
+        # urllib3 retries, the adapter only paces the requests
+        adapter = RateLimitedAdapter(
+            rate_controller, retries=0, pool_connections=1, pool_maxsize=pool_size, max_retries=retry
+        )
+    else:
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    mount_adapter(session, adapter)
+    return session
+
+
+def retry_after(response):
+    """
+    Returns: seconds to wait requested by the Retry-After header of the response (at most MAX_RETRY_AFTER),
+             None when there is none
+    """
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        date = email.utils.parsedate_tz(value)
+        if date is None:
+            return None
+        seconds = email.utils.mktime_tz(date) - time.time()
+    return min(max(0.0, seconds), MAX_RETRY_AFTER)
+
+
+class RateController(object):
+    """
+    Adaptive client side rate limit of the requests sent to report portal (AIMD).
+
+    The rate is not limited (up to max_rps) until the server shows it is overloaded: when
+    OVERLOAD_SHARE (and at least OVERLOAD_MIN_RESPONSES) of the responses of the last second
+    are 429, 502, 503 or 504 the rate is halved (an occasional one is not overload), a smoothed latency LATENCY_SPIKE_FACTOR
+    times above the lowest one seen lowers it a bit. Other errors (e.g. 500) are not caused
+    by the load and do not change it. Every other response raises the rate by RATE_INCREASE
+    requests/s per second, or by RATE_RECOVERY of it when that is more, so a fast server
+    is used fully again within seconds. Retry-After pauses all the requests.
+    The controller is shared by the adapters of all the sessions.
+    """
+
+    def __init__(self, max_rps=None):
+        self.max_rps = max_rps
+        self.rate = max_rps
+        self.lock = threading.Lock()
+        self.next_slot = 0.0
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        # endpoint -> (smoothed latency, lowest smoothed latency)
+        self.latency = {}
+        self.started = collections.deque()
+        # (time, overloaded) of the responses of the last second
+        self.responses = collections.deque()
+
+    def acquire(self):
+        """
+        Waits for the slot of the next request.
+        """
+        with self.lock:
+            now = time.time()
+            start = max(now, self.paused_until)
+            if self.rate:
+                start = max(start, self.next_slot)
+                self.next_slot = start + 1.0 / self.rate
+            # requests started during the last second, the rate to start from when it is limited the first time
+            self.started.append(start)
+            while self.started and self.started[0] < now - 1.0:
+                self.started.popleft()
+        if start > now:
+            time.sleep(start - now)
+
+    def _decrease(self, factor, now):
+        # react once per second, the concurrent requests report the same congestion
+        if now - self.last_decrease < 1.0:
+            return
+        self.last_decrease = now
+        current = self.rate or max(len(self.started), MIN_RATE)
+        self.rate = max(MIN_RATE, current * factor)
+        logger.info("Report portal is overloaded, lowering the request rate to %.1f/s", self.rate)
+
+    def observe(self, endpoint, status_code, latency, pause=None):
+        with self.lock:
+            now = time.time()
+            # the latency is compared per endpoint, an attachment upload takes longer than an item start
+            average, lowest = self.latency.get(endpoint, (latency, latency))
+            average = 0.9 * average + 0.1 * latency
+            lowest = min(lowest, average)
+            self.latency[endpoint] = (average, lowest)
+            if pause:
+                self.paused_until = max(self.paused_until, now + pause)
+            self.responses.append((now, status_code in RETRY_STATUSES))
+            while self.responses[0][0] < now - 1.0:
+                self.responses.popleft()
+            overloaded = sum(1 for _, overload in self.responses if overload)
+            if status_code in RETRY_STATUSES:
+                if overloaded >= max(OVERLOAD_MIN_RESPONSES, OVERLOAD_SHARE * len(self.responses)):
+                    self._decrease(RATE_DECREASE, now)
+            elif average > LATENCY_FLOOR and average > LATENCY_SPIKE_FACTOR * lowest:
+                self._decrease(LATENCY_DECREASE, now)
+            elif self.rate:
+                # one response out of rate per second
+                self.rate += max(RATE_INCREASE / self.rate, RATE_RECOVERY)
+                if self.max_rps:
+                    self.rate = min(self.rate, self.max_rps)
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """
+    Transport adapter sending the requests at the pace of the RateController.
+
+    429/503 responses (and 502/504 of idempotent requests) are retried with exponential
+    backoff or after Retry-After, unless the body was a stream which can not be sent again
+    (a MultipartStream reading the attached file again can).
+    """
+
+    def __init__(self, controller, retries=DEFAULT_HTTP_RETRIES, backoff=DEFAULT_HTTP_BACKOFF, **kwargs):
+        self.controller = controller
+        self.retries = retries
+        self.backoff = backoff
+        super(RateLimitedAdapter, self).__init__(**kwargs)
+
+    def _should_retry(self, request, response, attempt):
+        if attempt >= self.retries or response.status_code not in RETRY_STATUSES:
+            return False
+        body = request.body
+        if body is not None and not isinstance(body, (bytes, str)) and not getattr(body, 'replayable', False):
+            return False
+        return response.status_code in REFUSED_STATUSES or request.method in IDEMPOTENT_METHODS
+
+    def send(self, request, **kwargs):
+        attempt = 0
+        while True:
+            self.controller.acquire()
+            start = time.time()
+            response = super(RateLimitedAdapter, self).send(request, **kwargs)
+            pause = retry_after(response)
+            self.controller.observe(
+                Metrics.endpoint(request.method, request.url), response.status_code, time.time() - start, pause
+            )
+            if not self._should_retry(request, response, attempt):
+                response.rp_cli_retries = attempt
+                return response
+
+            delay = pause if pause is not None else self.backoff * (2 ** attempt)
+            logger.warning(
+                "%s %s returned %s, retrying in %.1fs", request.method, request.url, response.status_code, delay
+            )
+            # read the error body, so the connection goes back to the pool
+            response.content
+            time.sleep(delay)
+            attempt += 1
+
+
+def mount_adapter(session, adapter):
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+
+def file_log_body(log_item, path, mime=None, max_size=None, compress_threshold=None):
+    """
+    Builds the streamed multipart body of a log entry with the file attached.
+
+    Args:
+        log_item: log entry, its "file" name is set here
+        path: file to attach
+        mime: content type of the file
+        max_size: files bigger than this are truncated to their head and tail
+        compress_threshold: files bigger than this are gzipped
+
+    Returns: MultipartStream
+    """
+    name = log_item["file"]["name"]
+    compress = compress_threshold is not None and os.path.getsize(path) > compress_threshold
+    if compress:
+        name += '.gz'
+        mime = 'application/gzip'
+    log_item["file"] = {"name": name}
+
+    def chunks():
+        # called again when the request is retried
+        file_chunks = iter_file_chunks(path, max_size)
+        return gzip_chunks(file_chunks) if compress else file_chunks
+
+    return MultipartStream([
+        ("json_request_part", None, "application/json", [json.dumps([log_item]).encode('utf-8')]),
+        ("file", name, mime or "application/octet-stream", chunks),
+    ])
+
+
+class AttachmentIndex(object):
+    """
+    Content index of the attachments uploaded to report portal, so every distinct content is uploaded once.
+
+    The files are identified by the sha256 of their content. The digests are cached by
+    (device, inode, size, mtime), a log file shared by many test cases is read once.
+    The index can be kept in a json file to reference the uploads of the previous
+    launches as well, only the ones to the same report portal project are used.
+    """
+
+    def __init__(self, path=None, scope=None, min_size=DEDUP_MIN_SIZE):
+        self.path = path
+        self.scope = scope
+        self.min_size = min_size
+        # stat key -> sha256, sha256 -> {launch, item, item_id, name} of the first upload
+        self.digests = {}
+        self.blobs = {}
+        self.added = []
+        # sha256 -> event set once the upload of the new content is over, the uploads are registered
+        # by the reporting threads
+        self.uploading = {}
+        self.lock = threading.Lock()
+        self.duplicates = 0
+        self.duplicate_bytes = 0
+        if path and os.path.exists(path):
+            self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as index:
+                data = json.load(index)
+        except (OSError, IOError, ValueError) as error:
+            logger.warning('Ignoring the attachment index %s: %s', self.path, error)
+            return
+        if data.get('scope') != self.scope:
+            logger.info('The attachment index %s belongs to another project, it is not used', self.path)
+            return
+        self.digests = data.get('files', {})
+        self.blobs = data.get('blobs', {})
+        logger.info('Loaded %s attachments of previous launches from %s', len(self.blobs), self.path)
+
+    def digest(self, path):
+        """
+        Returns: sha256 of the file content, None for the files smaller than min_size
+        """
+        status = os.stat(path)
+        if status.st_size < self.min_size:
+            return None
+        key = '{0}:{1}:{2}:{3}'.format(status.st_dev, status.st_ino, status.st_size, status.st_mtime_ns)
+        digest = self.digests.pop(key, None)
+        if digest is None:
+            sha = hashlib.sha256()
+            for chunk in iter_file_chunks(path):
+                sha.update(chunk)
+            digest = sha.hexdigest()
+        # most recently used last, the oldest ones are dropped when the index is saved
+        self.digests[key] = digest
+        return digest
+
+    def lookup(self, path, wait=True):
+        """
+        Looks the content of the file up.
+
+        The caller uploads a new content, add() registers it once it was uploaded and release()
+        has to be called when the upload is over, whether it succeeded or not. Meanwhile the copies
+        of the content wait for the upload, or are uploaded as well when wait is False.
+
+        Returns: (sha256, {launch, item, item_id, name} of the first upload) for a duplicate,
+                 (sha256, None) for a new content, (None, None) for a file to upload without registering it
+        """
+        try:
+            digest = self.digest(path)
+        except OSError:
+            return None, None
+        if digest is None:
+            return None, None
+        while True:
+            with self.lock:
+                first = self.blobs.pop(digest, None)
+                if first is not None:
+                    self.blobs[digest] = first
+                    self.duplicates += 1
+                    break
+                uploading = self.uploading.get(digest)
+                if uploading is None:
+                    self.uploading[digest] = threading.Event()
+                    return digest, None
+            if not wait:
+                return None, None
+            # the content is looked up again, a failed upload is retried by this copy
+            uploading.wait()
+        self.duplicate_bytes += os.path.getsize(path)
+        return digest, first
+
+    def add(self, digest, item, name, item_id):
+        """
+        Registers the content as uploaded by the test case item (report portal id item_id) under name.
+        """
+        with self.lock:
+            if digest not in self.blobs:
+                self.blobs[digest] = {'launch': None, 'item': item, 'item_id': item_id, 'name': name}
+                self.added.append(digest)
+
+    def release(self, digest):
+        """
+        Ends the upload of the content, its waiting copies are looked up again.
+        """
+        with self.lock:
+            uploading = self.uploading.pop(digest, None)
+        if uploading is not None:
+            uploading.set()
+
+    def save(self, launch_id):
+        """
+        Writes the index, the contents uploaded by this run reference the launch_id.
+        """
+        for digest in self.added:
+            self.blobs[digest]['launch'] = launch_id
+        self.added = []
+        data = {
+            'scope': self.scope,
+            'files': dict(list(self.digests.items())[-ATTACHMENT_INDEX_MAX_ENTRIES:]),
+            'blobs': dict(list(self.blobs.items())[-ATTACHMENT_INDEX_MAX_ENTRIES:]),
+        }
+        index_dir = os.path.dirname(os.path.abspath(self.path))
+        with tempfile.NamedTemporaryFile('w', dir=index_dir, delete=False) as index:
+            json.dump(data, index)
+        os.replace(index.name, self.path)
+
+
+class RunDigest(object):
+    """
+    Compact digest of the test cases reported to a launch, kept as <launch id>.digest in digest_dir.
+
+    Every test case (by its class name, name and occurrence) has a short hash of its status,
+    time and failure or skip message, so the test cases which changed in a later xunit of the
+    same run (e.g. the rerun flaky ones) can be found without asking report portal.
+    """
+
+    def __init__(self, digest_dir):
+        self.digest_dir = digest_dir
+        self.cases = {}
+
+    def _path(self, launch_id):
+        return os.path.join(self.digest_dir, launch_id + DIGEST_SUFFIX)
+
+    def load(self, launch_id):
+        """
+        Returns: key -> hash of the test cases of the launch
+        """
+        try:
+            with open(self._path(launch_id), 'rb') as digest:
+                data = json.loads(zlib.decompress(digest.read()).decode('utf-8'))
+        except (OSError, IOError, ValueError, zlib.error) as error:
+            logger.error('Could not read the digest of the launch %s: %s', launch_id, error)
+            sys.exit(1)
+        return data['cases']
+
+    @staticmethod
+    def case_hash(case):
+        message = case.failure or case.skip_message
+        data = json.dumps([case.status, case.time, message], sort_keys=True, default=str)
+        return hashlib.blake2b(data.encode('utf-8'), digest_size=DIGEST_HASH_SIZE).hexdigest()
+
+    def add(self, key, case):
+        """
+        Returns: hash of the test case
+        """
+        case_hash = self.case_hash(case)
+        self.cases[key] = case_hash
+        return case_hash
+
+    def save(self, launch_id):
+        if not os.path.isdir(self.digest_dir):
+            os.makedirs(self.digest_dir)
+        data = json.dumps({'launch': launch_id, 'cases': self.cases}, separators=(',', ':'))
+        with tempfile.NamedTemporaryFile(dir=self.digest_dir, delete=False) as digest:
+            digest.write(zlib.compress(data.encode('utf-8')))
+        os.replace(digest.name, self._path(launch_id))
+
+
+def rerun_launch_data(name, start_time, description, tags, rerun_of):
+    """
+    Returns: launch start request of a rerun, report portal 5 reopens the launch rerun_of and
+             shows the test items reported again as retries
+    """
+    return {
+        "name": name, "description": description, "tags": tags, "start_time": start_time,
+        "rerun": True, "rerunOf": rerun_of,
+    }
+
+
+class Journal(object):
+    """
+    Append-only journal of the feed_results progress, used to resume an interrupted run.
+
+    Every line is a json record: launch / launch_end, folder / folder_end, item / item_end
+    and logs (number of log entries sent to an item). Records are written once the requests
+    they stand for succeeded and flushed right away, so a killed rp_cli loses at most the
+    line being written, which is ignored when the journal is loaded.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.lock = threading.Lock()
+        self.launch_id = None
+        self.launch_finished = False
+        # key -> {'id': item id, 'logs': sent log entries, 'finished': bool}
+        self.folders = {}
+        self.items = {}
+
+    def load(self):
+        keys = {}
+        with open(self.path) as fh:
+            for line_number, line in enumerate(fh, 1):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning("Ignoring the broken line %s of the journal %s", line_number, self.path)
+                    continue
+
+                op = record.get('op')
+                if op == 'launch':
+                    self.launch_id = record['id']
+                elif op == 'launch_end':
+                    self.launch_finished = True
+                elif op in ('folder', 'item'):
+                    states = self.folders if op == 'folder' else self.items
+                    states[record['key']] = {'id': record['id'], 'logs': 0, 'finished': False}
+                    keys[record['id']] = (states, record['key'])
+                elif op in ('folder_end', 'item_end'):
+                    states = self.folders if op == 'folder_end' else self.items
+                    if record['key'] in states:
+                        states[record['key']]['finished'] = True
+                elif op == 'logs' and record['id'] in keys:
+                    states, key = keys[record['id']]
+                    states[key]['logs'] += record['count']
+
+    def open(self, resume=False):
+        """
+        Opens the journal for writing, a new run starts with an empty journal.
+        """
+        if resume and os.path.exists(self.path):
+            self.load()
+            self._drop_partial_line()
+        self.file = open(self.path, 'a' if resume else 'w')
+
+    def _drop_partial_line(self):
+        # the line being written when rp_cli was killed, the next record would be appended to it
+        with open(self.path, 'rb+') as fh:
+            end = position = fh.seek(0, os.SEEK_END)
+            while position > 0:
+                start = max(0, position - JOURNAL_READ_BLOCK)
+                fh.seek(start)
+                newline = fh.read(position - start).rfind(b'\n')
+                if newline != -1:
+                    position = start + newline + 1
+                    break
+                position = start
+            if position < end:
+                logger.warning("Dropping the partial last line of the journal %s", self.path)
+                fh.truncate(position)
+
+    def write(self, record):
+        line = json.dumps(record) + '\n'
+        # written by the reporting threads of all the --folder_workers
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+            if record['op'] in ('launch', 'launch_end', 'folder_end'):
+                os.fsync(self.file.fileno())
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class RpServiceAsync(ReportPortalServiceAsync):
+    """
+    Async service which flushes the log batch when it reaches log_batch_size entries
+    or log_batch_bytes bytes (the client flushes it at every other call as well,
+    e.g. the test item finish) and counts the sent entries and batch requests.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.log_batch_bytes = kwargs.pop('log_batch_bytes', DEFAULT_LOG_BATCH_BYTES)
+        self.attachment_max_size = kwargs.pop('attachment_max_size', None)
+        self.attachment_compress_threshold = kwargs.pop('attachment_compress_threshold', None)
+        self.journal = kwargs.pop('journal', None)
+        self.log_batch_current_bytes = 0
+        self.logs_count = 0
+        self.log_batches_count = 0
+        self.failed_requests = 0
+        self.journaled_failures = 0
+        # methods handled by this class instead of the rp_client
+        self.local_methods = [
+            "log_file", "checkpoint", "rerun_launch", "resume_launch", "resume_item", "leave_item",
+            "resolve_launch_id",
+        ]
+        super(RpServiceAsync, self).__init__(*args, **kwargs)
+        if self.error_handler:
+            self.error_handler = functools.partial(self._count_error, self.error_handler)
+
+    def _count_error(self, error_handler, exc_info):
+        self.failed_requests += 1
+        error_handler(exc_info)
+
+    @staticmethod
+    def _log_item_size(log_item):
+        size = len(log_item.get('message') or '')
+        attachment = log_item.get('attachment')
+        if attachment:
+            size += len(attachment.get('data') or '')
+        return size
+
+    def _stop_listener(self, nowait):
+        # QueueListener.stop() of the client calls Thread.isAlive(), which is gone since python 3.9
+        listener = self.listener
+        listener._stop.set()
+        if nowait:
+            listener._stop_nowait.set()
+        listener.queue.put_nowait(listener._sentinel_item)
+        if listener._thread.is_alive() and listener._thread is not threading.current_thread():
+            listener._thread.join()
+        listener._thread = None
+
+    def terminate(self, nowait=False):
+        logger.debug("Acquiring lock for service termination")
+        with self.lock:
+            if not self.listener:
+                logger.warning("Service already stopped.")
+                return
+
+            self._stop_listener(nowait)
+
+            try:
+                if not nowait:
+                    self._post_log_batch()
+            except Exception:
+                if self.error_handler:
+                    self.error_handler(sys.exc_info())
+                else:
+                    raise
+            finally:
+                self.queue = None
+                self.listener = None
+
+    def _post_log_batch(self):
+        count = len(self.log_batch)
+        if count:
+            self.log_batches_count += 1
+        self.log_batch_current_bytes = 0
+        super(RpServiceAsync, self)._post_log_batch()
+        if count and self.journal is not None:
+            self.journal.write({'op': 'logs', 'id': self.rp_client.stack[-1], 'count': count})
+
+    def process_log(self, **log_item):
+        size = self._log_item_size(log_item)
+        if self.log_batch and self.log_batch_current_bytes + size > self.log_batch_bytes:
+            self._post_log_batch()
+
+        self.log_batch.append(log_item)
+        self.log_batch_current_bytes += size
+        self.logs_count += 1
+
+        if len(self.log_batch) >= self.log_batch_size or self.log_batch_current_bytes >= self.log_batch_bytes:
+            self._post_log_batch()
+
+    def process_item(self, item):
+        method, kwargs = item
+        if method not in self.local_methods:
+            return super(RpServiceAsync, self).process_item(item)
+
+        try:
+            self._post_log_batch()
+            getattr(self, "_process_" + method)(**kwargs)
+        except Exception:
+            if self.error_handler:
+                self.error_handler(sys.exc_info())
+            else:
+                self.terminate(nowait=True)
+                raise
+
+    @property
+    def launch_id(self):
+        return self.rp_client.launch_id
+
+    @property
+    def session(self):
+        return self.rp_client.session
+
+    def _process_log_file(self, time, message, level, path, name, mime, delete_after, on_sent, on_success):
+        try:
+            log_item = {
+                "item_id": self.rp_client.stack[-1],
+                "time": time,
+                "message": message,
+                "level": level,
+                "file": {"name": name},
+            }
+            body = file_log_body(
+                log_item, path, mime, self.attachment_max_size, self.attachment_compress_threshold
+            )
+            req = self.rp_client.session.post(
+                url=uri_join(self.rp_client.base_url, "log"),
+                data=body,
+                headers={"Content-Type": body.content_type},
+                verify=self.rp_client.verify_ssl,
+            )
+            req.raise_for_status()
+            self.logs_count += 1
+            self.log_batches_count += 1
+            if self.journal is not None:
+                self.journal.write({'op': 'logs', 'id': self.rp_client.stack[-1], 'count': 1})
+            if on_success is not None:
+                on_success(self.rp_client.stack[-1])
+        finally:
+            if delete_after:
+                os.remove(path)
+            if on_sent is not None:
+                on_sent()
+
+    def log_file(self, time, message, level, path, name=None, mime=None, delete_after=False, on_sent=None,
+                 on_success=None):
+        """
+        Logs a message with the file attached.
+
+        The file is opened only when the request is being sent and streamed in chunks,
+        so memory does not depend on the size of the file.
+
+        Args:
+            path: file to attach
+            name: attachment name (default: file base name)
+            mime: content type (default: guessed from the file name)
+            delete_after: remove the file once it was sent
+            on_sent: function called once the file was sent (or failed to be)
+            on_success: function called with the id of the test item once the file was sent
+        """
+        logger.debug("log_file queued")
+
+        args = {
+            "time": time,
+            "message": message,
+            "level": level,
+            "path": os.path.abspath(path),
+            "name": name or os.path.basename(path),
+            "mime": mime or guess_type(path)[0],
+            "delete_after": delete_after,
+            "on_sent": on_sent,
+            "on_success": on_success,
+        }
+        self.queue.put_nowait(("log_file", args))
+
+    def _process_checkpoint(self, op, fields):
+        # the record stands for the requests queued before it, it is not written when one of them failed
+        if self.failed_requests != self.journaled_failures:
+            self.journaled_failures = self.failed_requests
+            logger.warning("Not journaling %s %s, a request failed", op, fields.get('key', ''))
+            return
+
+        record = dict(fields, op=op)
+        if op == 'launch':
+            record['id'] = self.rp_client.launch_id
+        elif op in ('folder', 'item'):
+            record['id'] = self.rp_client.stack[-1]
+        self.journal.write(record)
+
+    def checkpoint(self, op, **fields):
+        """
+        Writes the record to the journal once everything queued before was sent.
+        """
+        self.queue.put_nowait(("checkpoint", {"op": op, "fields": fields}))
+
+    def _process_rerun_launch(self, name, start_time, description, tags, rerun_of):
+        req = self.rp_client.session.post(
+            url=uri_join(self.rp_client.base_url, "launch"),
+            json=rerun_launch_data(name, start_time, description, tags, rerun_of),
+            verify=self.rp_client.verify_ssl,
+        )
+        req.raise_for_status()
+        self.rp_client.launch_id = req.json()["id"]
+        self.rp_client.stack.append(None)
+
+    def rerun_launch(self, name, start_time, rerun_of, description=None, tags=None):
+        """
+        Starts the launch as a rerun of the launch rerun_of, see rerun_launch_data().
+        """
+        self.queue.put_nowait(("rerun_launch", {
+            "name": name, "start_time": start_time, "description": description, "tags": tags, "rerun_of": rerun_of,
+        }))
+
+    def _process_resume_launch(self, launch_id):
+        self.rp_client.launch_id = launch_id
+        self.rp_client.stack.append(None)
+
+    def resume_launch(self, launch_id):
+        """
+        Reports to the already started launch instead of starting a new one.
+        """
+        self.queue.put_nowait(("resume_launch", {"launch_id": launch_id}))
+
+    def _process_resume_item(self, item_id):
+        self.rp_client.stack.append(item_id)
+
+    def resume_item(self, item_id):
+        """
+        Makes the already started test item the current one, as start_test_item would.
+        """
+        self.queue.put_nowait(("resume_item", {"item_id": item_id}))
+
+    def _process_leave_item(self):
+        self.rp_client.stack.pop()
+
+    def _process_resolve_launch_id(self, future):
+        future.set_result(self.rp_client.launch_id)
+
+    def get_launch_id(self):
+        """
+        Waits until everything queued before was sent.
+
+        Returns: id of the launch, None if it could not be started
+        """
+        future = Future()
+        self.queue.put_nowait(("resolve_launch_id", {"future": future}))
+        return future.result()
+
+    def leave_item(self):
+        """
+        Leaves the current test item without finishing it (it was finished before).
+        """
+        self.queue.put_nowait(("leave_item", {}))
+
+
+class _ItemHandle(object):
+    """
+    Launch or test item of the AsyncioReportingEngine.
+
+    id is resolved once the item was created on the server, tasks are the pending
+    requests (logs, finished children) which have to be done before the item finishes.
+    """
+
+    def __init__(self):
+        self.id = Future()
+        self.tasks = []
+        self.log_batch = []
+        self.log_batch_bytes = 0
+
+    def add_task(self, task):
+        # do not keep thousands of finished tasks of long living items
+        if len(self.tasks) >= 1000:
+            self.tasks = [pending for pending in self.tasks if not pending.done()]
+        self.tasks.append(task)
+
+
+class AsyncioReportingEngine(object):
+    """
+    Reporting engine pipelining independent requests over several connections.
+
+    It has the interface of RpServiceAsync. Requests run on an asyncio loop in a background
+    thread and are sent by a pool of `connections` HTTP connections. A test item is started
+    only after its parent was, its logs and attachments are sent as soon as the item exists
+    and it is finished once all of them (and its children) are done. The calls block while
+    `max_in_flight` requests are pending, which slows the parser down to the pace of the server.
+    """
+
+    def __init__(self, endpoint, project, token, api_base="api/v1", error_handler=None,
+                 log_batch_size=DEFAULT_LOG_BATCH_SIZE, log_batch_bytes=DEFAULT_LOG_BATCH_BYTES,
+                 attachment_max_size=None, attachment_compress_threshold=None,
+                 connections=DEFAULT_CONNECTIONS, max_in_flight=DEFAULT_MAX_IN_FLIGHT, verify_ssl=True,
+                 timeout=None):
+        self.base_url = uri_join(endpoint, api_base, project)
+        self.error_handler = error_handler
+        self.log_batch_size = log_batch_size
+        self.log_batch_bytes = log_batch_bytes
+        self.attachment_max_size = attachment_max_size
+        self.attachment_compress_threshold = attachment_compress_threshold
+        self.verify_ssl = verify_ssl
+        # (connect, read) timeouts of every request
+        self.timeout = timeout
+        self.logs_count = 0
+        self.log_batches_count = 0
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=connections)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers["Authorization"] = "bearer {0}".format(token)
+
+        self.slots = threading.BoundedSemaphore(max_in_flight)
+        self.pending = set()
+        self.pending_lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=connections)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="rp-asyncio")
+        self.thread.daemon = True
+        self.thread.start()
+
+        self.launch = _ItemHandle()
+        self.stack = [self.launch]
+
+    @property
+    def launch_id(self):
+        if self.launch.id.done() and not self.launch.id.exception():
+            return self.launch.id.result()
+        return None
+
+    def get_launch_id(self):
+        """
+        Waits until the launch was started.
+
+        Returns: id of the launch, None if it could not be started
+        """
+        if self.launch.id.exception():
+            return None
+        return self.launch.id.result()
+
+    def _submit(self, coroutine_function, *args):
+        # blocks the caller while the in-flight window is full
+        self.slots.acquire()
+        task = asyncio.run_coroutine_threadsafe(self._run(coroutine_function, *args), self.loop)
+        with self.pending_lock:
+            self.pending.add(task)
+        task.add_done_callback(self._task_done)
+        return task
+
+    def _task_done(self, task):
+        with self.pending_lock:
+            self.pending.discard(task)
+
+    async def _run(self, coroutine_function, *args):
+        try:
+            return await coroutine_function(*args)
+        except Exception:
+            if self.error_handler:
+                self.error_handler(sys.exc_info())
+            raise
+        finally:
+            self.slots.release()
+
+    async def _request(self, method, path, **kwargs):
+        request = functools.partial(
+            self.session.request, method, uri_join(self.base_url, path), verify=self.verify_ssl,
+            timeout=self.timeout, **kwargs
+        )
+        response = await self.loop.run_in_executor(self.executor, request)
+        response.raise_for_status()
+        return response.json()
+
+    @staticmethod
+    async def _wait(tasks):
+        for task in tasks:
+            try:
+                await asyncio.wrap_future(task)
+            except Exception:
+                # already reported by the error handler
+                pass
+
+    @staticmethod
+    async def _id(handle):
+        return await asyncio.wrap_future(handle.id)
+
+    async def _create(self, handle, path, data, parent=None):
+        try:
+            if parent is not None:
+                data["launch_id"] = await self._id(self.launch)
+                if parent is not self.launch:
+                    path = uri_join(path, await self._id(parent))
+            handle.id.set_result((await self._request("POST", path, json=data))["id"])
+        except Exception as error:
+            # do not leave the children waiting for the id forever
+            handle.id.set_exception(error)
+            raise
+
+    async def _finish(self, handle, path, data, tasks):
+        handle_id = await self._id(handle)
+        await self._wait(tasks)
+        await self._request("PUT", path.format(id=handle_id), json=data)
+
+    async def _post_logs(self, handle, entries, attachments):
+        item_id = None if handle is self.launch else await self._id(handle)
+        for entry in entries:
+            entry["item_id"] = item_id
+        parts = [("json_request_part", None, "application/json", [json.dumps(entries).encode('utf-8')])]
+        parts.extend(attachments)
+        body = MultipartStream(parts)
+        await self._request("POST", "log", data=body, headers={"Content-Type": body.content_type})
+
+    async def _post_file(self, handle, log_item, path, mime, delete_after, on_sent, on_success):
+        try:
+            log_item["item_id"] = None if handle is self.launch else await self._id(handle)
+            body = file_log_body(log_item, path, mime, self.attachment_max_size, self.attachment_compress_threshold)
+            await self._request("POST", "log", data=body, headers={"Content-Type": body.content_type})
+            if on_success is not None:
+                on_success(log_item["item_id"])
+        finally:
+            if delete_after:
+                os.remove(path)
+            if on_sent is not None:
+                on_sent()
+
+    def _flush_logs(self, handle):
+        if not handle.log_batch:
+            return
+        entries, attachments = [], []
+        for entry in handle.log_batch:
+            attachment = entry.pop("attachment", None)
+            if attachment:
+                entry["file"] = {"name": attachment["name"]}
+                attachments.append((
+                    "file", attachment["name"], attachment.get("mime") or "application/octet-stream",
+                    [attachment["data"]]
+                ))
+            entries.append(entry)
+        handle.log_batch = []
+        handle.log_batch_bytes = 0
+        self.log_batches_count += 1
+        handle.add_task(self._submit(self._post_logs, handle, entries, attachments))
+
+    def start_launch(self, name, start_time, description=None, tags=None, mode=None):
+        data = {"name": name, "description": description, "tags": tags, "start_time": start_time, "mode": mode}
+        self._submit(self._create, self.launch, "launch", data)
+
+    def rerun_launch(self, name, start_time, rerun_of, description=None, tags=None):
+        data = rerun_launch_data(name, start_time, description, tags, rerun_of)
+        self._submit(self._create, self.launch, "launch", data)
+
+    def finish_launch(self, end_time, status=None):
+        self._flush_logs(self.launch)
+        data = {"end_time": end_time, "status": status}
+        self._submit(self._finish, self.launch, "launch/{id}/finish", data, list(self.launch.tasks))
+
+    def start_test_item(self, name, start_time, item_type, description=None, tags=None, parameters=None):
+        if parameters is not None:
+            parameters = [{"key": key, "value": str(value)} for key, value in parameters.items()]
+        data = {
+            "name": name, "description": description, "tags": tags, "start_time": start_time,
+            "type": item_type, "parameters": parameters,
+        }
+        handle = _ItemHandle()
+        parent = self.stack[-1]
+        self.stack.append(handle)
+        self._submit(self._create, handle, "item", data, parent)
+
+    def finish_test_item(self, end_time, status, issue=None):
+        handle = self.stack.pop()
+        self._flush_logs(handle)
+        data = {"end_time": end_time, "status": status, "issue": issue}
+        self.stack[-1].add_task(self._submit(self._finish, handle, "item/{id}", data, handle.tasks))
+
+    def log(self, time, message, level=None, attachment=None):
+        handle = self.stack[-1]
+        size = len(message or '') + (len(attachment.get("data") or '') if attachment else 0)
+        if handle.log_batch and handle.log_batch_bytes + size > self.log_batch_bytes:
+            self._flush_logs(handle)
+
+        handle.log_batch.append({"time": time, "message": message, "level": level, "attachment": attachment})
+        handle.log_batch_bytes += size
+        self.logs_count += 1
+
+        if len(handle.log_batch) >= self.log_batch_size or handle.log_batch_bytes >= self.log_batch_bytes:
+            self._flush_logs(handle)
+
+    def log_file(self, time, message, level, path, name=None, mime=None, delete_after=False, on_sent=None,
+                 on_success=None):
+        handle = self.stack[-1]
+        log_item = {"time": time, "message": message, "level": level, "file": {"name": name or os.path.basename(path)}}
+        self.logs_count += 1
+        self.log_batches_count += 1
+        handle.add_task(self._submit(
+            self._post_file, handle, log_item, os.path.abspath(path), mime or guess_type(path)[0], delete_after,
+            on_sent, on_success
+        ))
+
+    def terminate(self, nowait=False):
+        if not nowait:
+            while True:
+                with self.pending_lock:
+                    pending = list(self.pending)
+                if not pending:
+                    break
+                for task in pending:
+                    try:
+                        task.result()
+                    except Exception:
+                        pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.executor.shutdown(wait=True)
+
+
+class SpoolWriter(object):
+    """
+    Writes the reporting operations to a spool directory instead of sending them.
+
+    It has the interface of RpServiceAsync. The operations are appended to ops.bin as
+    length-prefixed json records, attached files are stored once under blobs/<sha256>.
+    The spool is sent to report portal later by --replay.
+    """
+
+    def __init__(self, spool_dir):
+        self.spool_dir = spool_dir
+        self.blobs_dir = os.path.join(spool_dir, SPOOL_BLOBS_DIR)
+        if not os.path.isdir(self.blobs_dir):
+            os.makedirs(self.blobs_dir)
+        self.ops = open(os.path.join(spool_dir, SPOOL_OPS_FILE), 'wb')
+        self.ops.write(SPOOL_MAGIC)
+        self.launch_id = None
+        self.ops_count = 0
+        self.blobs_count = 0
+        self.logs_count = 0
+        self.log_batches_count = 0
+
+    def _write(self, op, **args):
+        data = json.dumps({'op': op, 'args': args}).encode('utf-8')
+        self.ops.write(SPOOL_RECORD_HEADER.pack(len(data)))
+        self.ops.write(data)
+        self.ops_count += 1
+
+    def _store_blob(self, chunks):
+        """
+        Stores the content, hashing it while it is copied.
+
+        Returns: sha256 of the content, which is the name of the blob
+        """
+        digest = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(dir=self.blobs_dir, delete=False) as tmp:
+            for chunk in chunks:
+                digest.update(chunk)
+                tmp.write(chunk)
+        blob = digest.hexdigest()
+        blob_path = os.path.join(self.blobs_dir, blob)
+        if os.path.exists(blob_path):
+            os.remove(tmp.name)
+        else:
+            os.rename(tmp.name, blob_path)
+            self.blobs_count += 1
+        return blob
+
+    def start_launch(self, name, start_time, description=None, tags=None, mode=None):
+        self._write('start_launch', name=name, start_time=start_time, description=description, tags=tags, mode=mode)
+
+    def finish_launch(self, end_time, status=None):
+        self._write('finish_launch', end_time=end_time, status=status)
+
+    def start_test_item(self, name, start_time, item_type, description=None, tags=None, parameters=None):
+        self._write(
+            'start_test_item', name=name, start_time=start_time, item_type=item_type, description=description,
+            tags=tags, parameters=parameters
+        )
+
+    def finish_test_item(self, end_time, status, issue=None):
+        self._write('finish_test_item', end_time=end_time, status=status, issue=issue)
+
+    def log(self, time, message, level=None, attachment=None):
+        self.logs_count += 1
+        if not attachment:
+            return self._write('log', time=time, message=message, level=level)
+
+        if not isinstance(attachment, dict):
+            attachment = {"data": attachment}
+        data = attachment["data"]
+        blob = self._store_blob([data.encode('utf-8') if isinstance(data, str) else data])
+        self._write(
+            'log_file', time=time, message=message, level=level, blob=blob,
+            name=attachment.get("name", blob), mime=attachment.get("mime")
+        )
+
+    def log_file(self, time, message, level, path, name=None, mime=None, delete_after=False, on_sent=None,
+                 on_success=None):
+        # nothing is uploaded before the replay, on_success is never called
+        try:
+            blob = self._store_blob(iter_file_chunks(path))
+            self._write(
+                'log_file', time=time, message=message, level=level, blob=blob,
+                name=name or os.path.basename(path), mime=mime or guess_type(path)[0]
+            )
+            self.logs_count += 1
+        finally:
+            if delete_after:
+                os.remove(path)
+            if on_sent is not None:
+                on_sent()
+
+    def terminate(self, nowait=False):
+        self.ops.flush()
+        os.fsync(self.ops.fileno())
+        self.ops.close()
+
+
+def read_spool(spool_dir):
+    """
+    Reads the operations of the spool, a record truncated by an interrupted rp_cli ends it.
+
+    Returns: generator of (operation, arguments)
+    """
+    with open(os.path.join(spool_dir, SPOOL_OPS_FILE), 'rb') as ops:
+        if ops.read(len(SPOOL_MAGIC)) != SPOOL_MAGIC:
+            logger.error("%s is not a rp_cli spool", spool_dir)
+            sys.exit(1)
+        while True:
+            header = ops.read(SPOOL_RECORD_HEADER.size)
+            if not header:
+                return
+            length = SPOOL_RECORD_HEADER.unpack(header)[0] if len(header) == SPOOL_RECORD_HEADER.size else None
+            data = ops.read(length) if length is not None else b''
+            if length is None or len(data) < length:
+                logger.warning("The spool %s ends with a truncated record", spool_dir)
+                return
+            record = json.loads(data.decode('utf-8'))
+            yield record['op'], record['args']
+
+
+class RpManager:
+    def __init__(self, config, strategy, http_adapter=None):
+        """
+        Args:
+            http_adapter: adapter (connection pool and rate control) shared with other managers
+        """
+        self.url = config.get('rp_endpoint')
+        self.uuid = config.get('rp_uuid')
+        self.project = config.get('rp_project')
+        self.launch_description = config.get('launch_description')
+        self.launch_tags = (config.get('launch_tags') or '').split()
+        self.upload_xunit = config.get('upload_xunit')
+        self.update_headers = {
+            'Authorization': 'bearer %s' % self.uuid,
+            'Accept': 'application/json',
+            'Cache-Control': 'no-cache',
+            'content-type': 'application/json',
+        }
+        self.import_headers = {
+            'Authorization': 'bearer %s' % self.uuid,
+            'Accept': 'application/json',
+            'Cache-Control': 'no-cache',
+        }
+        self.launch_url = "{url}/api/v1/{project_name}/launch/%s".format(
+            url=self.url, project_name=self.project
+        )
+        self.launch_public_url = "{url}/ui/#{project_name}/launches/all/%s".format(
+            url=self.url, project_name=self.project
+        )
+        self.launch_id = ''
+        self.launch_ended = False
+        http_retries = config.get('http_retries')
+        self.http_retries = DEFAULT_HTTP_RETRIES if http_retries is None else http_retries
+        http_backoff = config.get('http_backoff')
+        self.http_backoff = DEFAULT_HTTP_BACKOFF if http_backoff is None else http_backoff
+        self.http_adapter = http_adapter
+        self.rate_controller = http_adapter.controller if http_adapter else RateController(config.get('max_rps'))
+        self.http = create_http_session(
+            retries=self.http_retries, backoff=self.http_backoff, rate_controller=self.rate_controller,
+        )
+        http_connect_timeout = config.get('http_connect_timeout')
+        http_read_timeout = config.get('http_read_timeout')
+        # a timeout of 0 waits forever
+        self.http_timeout = (
+            (DEFAULT_HTTP_CONNECT_TIMEOUT if http_connect_timeout is None else http_connect_timeout) or None,
+            (DEFAULT_HTTP_READ_TIMEOUT if http_read_timeout is None else http_read_timeout) or None,
+        )
+        self.xunit_feed = config.get('xunit_feed')
+        self.launch_name = config.get('launch_name', 'rp_cli-launch')
+        self.strategy = strategy
+        self.metrics = Metrics()
+        self.engine = config.get('engine') or DEFAULT_ENGINE
+        self.connections = config.get('connections') or DEFAULT_CONNECTIONS
+        self.max_in_flight = config.get('max_in_flight') or DEFAULT_MAX_IN_FLIGHT
+        self.log_batch_size = config.get('log_batch_size') or DEFAULT_LOG_BATCH_SIZE
+        self.log_batch_bytes = config.get('log_batch_bytes') or DEFAULT_LOG_BATCH_BYTES
+        self.attachment_max_size = config.get('attachment_max_size')
+        self.attachment_compress_threshold = config.get('attachment_compress_threshold')
+        self.journal = None
+        self.resume = config.get('resume')
+        self.spool = config.get('spool')
+        if self.spool and config.get('journal'):
+            logger.error('--journal can not be used with --spool, nothing is sent to report portal')
+            sys.exit(1)
+        if config.get('journal'):
+            if self.engine != 'thread':
+                logger.error('--journal is supported only by the thread engine')
+                sys.exit(1)
+            self.journal = Journal(config.get('journal'))
+        elif self.resume:
+            logger.error('--resume needs the --journal of the interrupted run')
+            sys.exit(1)
+        self.rerun_of = config.get('rerun_of')
+        self.run_digest = None
+        self.previous_digest = None
+        self.unchanged_cases = 0
+        if config.get('digest_dir'):
+            if self.spool or self.journal is not None:
+                logger.error('--digest_dir can not be used with --spool or --journal')
+                sys.exit(1)
+            self.run_digest = RunDigest(config.get('digest_dir'))
+            if self.rerun_of:
+                self.previous_digest = self.run_digest.load(self.rerun_of)
+        elif self.rerun_of:
+            logger.error('--rerun_of needs the --digest_dir of the launch')
+            sys.exit(1)
+        max_message_size = config.get('max_message_size')
+        max_case_log_size = config.get('max_case_log_size')
+        # 0 disables the limit
+        self.message_budget = MessageBudget(
+            max_message_size=(DEFAULT_MAX_MESSAGE_SIZE if max_message_size is None else max_message_size) or None,
+            max_case_size=(DEFAULT_MAX_CASE_LOG_SIZE if max_case_log_size is None else max_case_log_size) or None,
+            split=(config.get('oversize_messages') or DEFAULT_OVERSIZE_MODE) == 'split',
+        )
+        self.folder_workers = config.get('folder_workers') or 1
+        if self.folder_workers > 1 and (self.engine != 'thread' or self.spool):
+            logger.error('--folder_workers is supported only by the thread engine sending to report portal')
+            sys.exit(1)
+        self.workers = []
+        self.folders_seen = collections.Counter()
+        self.folders_opened = 0
+        self.folder_key = None
+        self.logs_to_skip = 0
+        self.resumed_items = 0
+        self.failed_requests = 0
+        self.service = self._create_service()
+        self.launch_service = self.service
+        self.test_logs = config.get('test_logs')
+        self.zipped = config.get('zipped')
+        self.archive_format = config.get('zip_format') or DEFAULT_ARCHIVE_FORMAT
+        self.archive_level = config.get('zip_level')
+        if self.archive_level is None:
+            self.archive_level = DEFAULT_ARCHIVE_LEVEL
+        self.archive_workers = config.get('zip_workers') or DEFAULT_ARCHIVE_WORKERS
+        self.archive_tmp_dir = config.get('zip_tmp_dir')
+        self.archives = None
+        self.log_index = None
+        self.log_index_workers = config.get('log_index_workers') or DEFAULT_LOG_INDEX_WORKERS
+        self.cases_without_logs = 0
+        self.attachment_index = None
+        # archive key -> (name, (sha256, first upload)) of the files left out of the archive
+        self.duplicate_attachments = {}
+        # archive key -> (sha256, item, name) of its files, registered in the attachment index once it was uploaded
+        self.archived_contents = {}
+        if config.get('attachment_index') and self.spool:
+            logger.error('--attachment_index can not be used with --spool, the launch is not created yet')
+            sys.exit(1)
+        if config.get('dedup_attachments') or config.get('attachment_index'):
+            self.attachment_index = AttachmentIndex(
+                config.get('attachment_index'), scope='{0}/{1}'.format(self.url, self.project)
+            )
+        if self.zipped and self.archive_format == 'zstd':
+            try:
+                import zstandard  # noqa: F401
+            except ImportError:
+                logger.error('zstd archives need the zstandard module: pip install zstandard')
+                sys.exit(1)
+        self.test_owners = config.get('test_owners') or {}
+        if not isinstance(self.test_owners, TestOwners):
+            self.test_owners = TestOwners(self.test_owners)
+        self.streaming = config.get('streaming')
+        self.parse_workers = config.get('parse_workers')
+        self.sort_buffer = config.get('sort_buffer') or DEFAULT_SORT_BUFFER
+        self.strategy = strategy
+
+    def _count_error(self, exc_info):
+        self.failed_requests += 1
+        self.strategy.my_error_handler(exc_info)
+
+    def _create_service(self):
+        if self.spool:
+            return SpoolWriter(self.spool)
+        kwargs = dict(
+            endpoint=self.url, project=self.project, token=self.uuid, error_handler=self._count_error,
+            log_batch_size=self.log_batch_size,
+            log_batch_bytes=self.log_batch_bytes,
+            attachment_max_size=self.attachment_max_size,
+            attachment_compress_threshold=self.attachment_compress_threshold,
+        )
+        if self.engine == 'asyncio':
+            service = AsyncioReportingEngine(
+                connections=self.connections, max_in_flight=self.max_in_flight, timeout=self.http_timeout, **kwargs
+            )
+            pool_size = self.connections
+        else:
+            service = RpServiceAsync(journal=self.journal, **kwargs)
+            pool_size = 1
+        mount_adapter(service.session, self.http_adapter or RateLimitedAdapter(
+            self.rate_controller, retries=self.http_retries, backoff=self.http_backoff,
+            pool_connections=1, pool_maxsize=pool_size,
+        ))
+        service.session.hooks['response'].append(self.metrics.observe_response)
+        return service
+
+    @staticmethod
+    def _check_return_code(req):
+        if req.status_code != 200:
+            try:
+                msg = req.json()['message']
+            except (ValueError, KeyError):
+                # e.g. HTML error page of a proxy
+                msg = req.text[:200]
+            logger.error('Something went wrong status code is %s; MSG: %s', req.status_code, msg)
+            sys.exit(1)
+
+    def _request(self, method, url, **kwargs):
+        req = self.http.request(
+            method, url, timeout=self.http_timeout, hooks={'response': self.metrics.observe_response}, **kwargs
+        )
+        retries = Metrics.retries(req)
+        if retries:
+            logger.warning('%s %s succeeded after %s retries', method, url, retries)
+        logger.info('%s %s: status %s in %.3fs', method, url, req.status_code, req.elapsed.total_seconds())
+        return req
+
+    def _import_body(self):
+        """
+        Streamed multipart body of the import: zip files are sent as they are,
+        xml files or directories of xml files are zipped on the fly.
+        """
+        path = self.upload_xunit.rstrip(os.sep)
+        if zipfile.is_zipfile(path):
+            name, chunks = os.path.basename(path), functools.partial(iter_file_chunks, path)
+        else:
+            if os.path.isdir(path):
+                xml_files = sorted(glob.glob(os.path.join(path, '*.xml')))
+            else:
+                xml_files = [path]
+            if not xml_files:
+                logger.error("No xunit files found in %s", path)
+                sys.exit(1)
+            # report portal names the launch after the zip file
+            name = os.path.splitext(os.path.basename(path))[0] + '.zip'
+            chunks = functools.partial(iter_zipped, [(xml_file, os.path.basename(xml_file)) for xml_file in xml_files])
+        return MultipartStream([('file', name, 'application/zip', chunks)])
+
+    def _import_results(self):
+        body = self._import_body()
+        headers = dict(self.import_headers)
+        headers['Content-Type'] = body.content_type
+        req = self._request('POST', self.launch_url % "import", headers=headers, data=body)
+
+        self._check_return_code(req)
+        response = req.json()
+        logger.info("Import is done successfully")
+        response_msg = response['msg'].encode('ascii', 'ignore').decode('ascii')
+        logger.info('Status code: %s; %s', req.status_code, response_msg)
+
+        # returning the launch_id
+        return response_msg.split()[4]
+
+    def _verify_upload_succeeded(self, launch_id):
+        launch_id_url = self.launch_url % launch_id
+        req = self._request('GET', launch_id_url, headers=self.update_headers)
+        self._check_return_code(req)
+        logger.info('Launch have been created successfully')
+        return True
+
+    def _update_launch_description_and_tags(self, launch_id):
+        update_url = self.launch_url % launch_id + "/update"
+
+        data = {
+            "description": self.launch_description,
+            "tags": self.launch_tags
+        }
+
+        req = self._request('PUT', update_url, headers=self.update_headers, data=json.dumps(data))
+        self._check_return_code(req)
+        logger.info(
+            'Launch description %s and tags %s where updated for launch id %s',
+            self.launch_description, self.launch_tags, launch_id
+        )
+
+    def import_results(self):
+        with self.metrics.phase('import'):
+            self.launch_id = self._import_results()
+        with self.metrics.phase('verify'):
+            self._verify_upload_succeeded(self.launch_id)
+        with self.metrics.phase('update'):
+            self._update_launch_description_and_tags(self.launch_id)
+        self.http.close()
+
+    def _start_launch(self):
+        if self.journal is not None and self.journal.launch_id:
+            logger.info("Resuming the launch %s", self.journal.launch_id)
+            self.service.resume_launch(self.journal.launch_id)
+            return self._start_workers(self.journal.launch_id)
+
+        if self.rerun_of:
+            logger.info("Reporting the test cases changed since the launch %s", self.rerun_of)
+            launch = self.service.rerun_launch(
+                name=self.launch_name, start_time=timestamp(), rerun_of=self.rerun_of,
+                description=self.launch_description, tags=self.launch_tags)
+            launch_id = self.service.get_launch_id()
+            if launch_id != self.rerun_of:
+                # report portal before 5 ignores the rerun and starts a new launch
+                logger.error(
+                    'Report portal started the launch %s instead of reopening the launch %s, it does not support '
+                    'reruns (report portal 5 does). The new launch is finished empty.', launch_id, self.rerun_of
+                )
+                if launch_id is not None:
+                    self.service.finish_launch(end_time=timestamp())
+                self.service.terminate()
+                sys.exit(1)
+        else:
+            launch = self.service.start_launch(
+                name=self.launch_name, start_time=timestamp(), description=self.launch_description,
+                tags=self.launch_tags)
+        if self.journal is not None:
+            self.service.checkpoint('launch', name=self.launch_name)
+        if self.folder_workers > 1:
+            self._start_workers(self.service.get_launch_id())
+        return launch
+
+    def stop_launch(self):
+        """
+        Stops the launch of a failed feed_results, report portal interrupts its unfinished test items.
+        """
+        if self.launch_ended:
+            return
+        self.launch_ended = True
+        for service in self.workers + [self.launch_service]:
+            try:
+                service.terminate(nowait=True)
+            except Exception:
+                logger.debug("Failed to stop the reporting service", exc_info=True)
+        if self.archives is not None:
+            self.archives.close()
+        launch_id = self.launch_service.launch_id
+        if not launch_id or self.spool:
+            return
+        data = {"end_time": timestamp(), "status": "STOPPED"}
+        req = self._request(
+            'PUT', self.launch_url % launch_id + "/stop", headers=self.update_headers, data=json.dumps(data)
+        )
+        if req.status_code != 200:
+            logger.error('Failed to stop the launch %s, status code %s', launch_id, req.status_code)
+        else:
+            logger.info('Stopped the launch %s', launch_id)
+
+    def _start_workers(self, launch_id):
+        """
+        Creates the --folder_workers services reporting to the launch, every one sends its folders.
+        """
+        if self.folder_workers <= 1:
+            return
+        if launch_id is None:
+            logger.error('The launch could not be started')
+            sys.exit(1)
+        for _ in range(self.folder_workers):
+            worker = self._create_service()
+            worker.resume_launch(launch_id)
+            self.workers.append(worker)
+
+    def _use_worker(self, shard=None):
+        """
+        Makes the worker of the shard (the least busy one for a new folder) the current service.
+        """
+        if not self.workers:
+            return
+        if shard is None:
+            self.service = min(self.workers, key=lambda worker: worker.queue.qsize())
+        else:
+            self.service = self.workers[zlib.crc32(shard.encode('utf-8')) % len(self.workers)]
+
+    def _wait_for_worker(self):
+        # the parser must not get too far ahead of the server
+        while self.service.queue.qsize() > FOLDER_WORKER_QUEUE:
+            time.sleep(0.01)
 
     def _end_launch(self):
+        # the launch is finished once all the workers sent their test items
+        with self.metrics.phase('launch_finish'):
+            for worker in self.workers:
+                worker.terminate()
+        self.service = self.launch_service
+
         self.service.finish_launch(end_time=timestamp())
-        self.service.terminate()
-        self.launch_id = self.service.rp_client.launch_id
-
-    def _upload_attachment(self, file, name):
-        with open(file, "rb") as fh:
-            attachment = {
-                "name": name,
-                "data": fh.read(),
-                "mime": guess_type(file)[0]
-            }
-            self.service.log(timestamp(), name, "INFO", attachment)
+        if self.journal is not None:
+            self.service.checkpoint('launch_end')
+        # waits for everything queued to be sent
+        with self.metrics.phase('launch_finish'):
+            self.service.terminate()
+        self.launch_ended = True
+        self.launch_id = self.service.launch_id
+        if self.spool:
+            logger.info(
+                'Spooled %s operations and %s attachments to %s', self.service.ops_count, self.service.blobs_count,
+                self.spool
+            )
+        else:
+            services = [self.service] + self.workers
+            logs_count = sum(service.logs_count for service in services)
+            log_batches_count = sum(service.log_batches_count for service in services)
+            logger.info(
+                'Sent %s log entries in %s batch requests (%s requests saved)',
+                logs_count, log_batches_count, logs_count - log_batches_count
+            )
+        if self.journal is not None:
+            self.journal.close()
+            if self.resume:
+                logger.info("%s test cases were reported before the launch was resumed", self.resumed_items)
 
-    def upload_test_case_attachments(self, path):
-        for root, dirs, files in os.walk(path):
-            for log_file in files:
-                file_name = os.path.join(root, log_file)
-                self._upload_attachment(file_name, log_file)
+    def _skip_log(self):
+        """
+        Returns: True if the log entry of a resumed test item was already sent
+        """
+        if self.logs_to_skip:
+            self.logs_to_skip -= 1
+            return True
+        return False
 
-    def upload_zipped_test_case_attachments(self, zip_file_name, path):
-        whole_path = os.path.join(self.test_logs, path)
-        try:
-            ld = os.listdir(whole_path)
-        except OSError:
-            logger.warning("Path (%s) with log files does not exist!" % (whole_path,))
+    def _upload_attachment(self, file, name, delete_after=False, on_sent=None, message=None, level="INFO", mime=None,
+                           on_success=None):
+        if self._skip_log():
+            if delete_after:
+                os.remove(file)
+            if on_sent is not None:
+                on_sent()
             return
-        # check if there is something to zip
-        if len(ld) > 0:
-            zip_file_name = shutil.make_archive(zip_file_name, 'zip', whole_path)
-            self._upload_attachment(zip_file_name, os.path.basename(zip_file_name))
-            os.remove(zip_file_name)
+        with self.metrics.phase('attachments'):
+            self.service.log_file(
+                timestamp(), message or name, level, file, name=name, mime=mime, delete_after=delete_after,
+                on_sent=on_sent, on_success=on_success
+            )
 
-        else:
-            logger.warning("There are no logs on the path (%s)!" % (whole_path, ))
+    def _log_index(self):
+        if self.log_index is None:
+            self.log_index = LogIndex(self.test_logs, self.log_index_workers)
+        return self.log_index
+
+    def _logs_of_case(self, case, path):
+        files = self._log_index().files(path)
+        if not files:
+            self.cases_without_logs += 1
+            logger.debug("No logs found for %s in %s", case.name, path)
+        return files
+
+    def _log_index_summary(self):
+        logger.info("%s failed test cases have no logs in %s", self.cases_without_logs, self.test_logs)
+        orphans = self.log_index.orphans()
+        if orphans:
+            logger.info(
+                "%s log directories do not belong to any failed test case: %s%s", len(orphans), ', '.join(orphans[:20]),
+                ' (and %s more)' % (len(orphans) - 20, ) if len(orphans) > 20 else ''
+            )
+            logger.debug("Log directories without failed test case: %s", ', '.join(orphans))
+
+    def _log_duplicate(self, name, digest, first):
+        where = ''
+        if first.get('item_id'):
+            where += ' (item {0})'.format(first['item_id'])
+        if first['launch'] is not None:
+            where += ' in the launch {0}'.format(self.launch_public_url % first['launch'])
+        self._send_log(
+            '{0}: same content as {1} attached to {2}{3} (sha256 {4})'.format(
+                name, first['name'], first['item'], where, digest),
+            'INFO'
+        )
+
+    def _register_uploads(self, contents, item_id):
+        for digest, item, name in contents:
+            self.attachment_index.add(digest, item, name, item_id)
+
+    def _release_uploads(self, contents, on_sent=None):
+        for digest, _, _ in contents:
+            self.attachment_index.release(digest)
+        if on_sent is not None:
+            on_sent()
+
+    def _attachment_index_summary(self):
+        index = self.attachment_index
+        logger.info('%s duplicate attachments (%s bytes) were not uploaded again', index.duplicates,
+                    index.duplicate_bytes)
+        if index.path is None:
+            return
+        if self.failed_requests or not self.launch_id:
+            logger.warning('Not updating the attachment index %s, some requests failed', index.path)
+            return
+        index.save(self.launch_id)
+
+    def upload_test_case_attachments(self, path, item=None):
+        """
+        Uploads one by one all the files under path (relative to test_logs).
 
-    def _log_message_to_rp_console(self, msg, level):
-        self.service.log(
-            time=timestamp(),
-            message=msg,
-            level=level
+        Args:
+            item: name of the test case, referenced by the duplicates of its files
+        """
+        for file_name in self._log_index().files(path) or []:
+            name = os.path.basename(file_name)
+            digest, first = self.attachment_index.lookup(file_name) if self.attachment_index else (None, None)
+            if first:
+                self._log_duplicate(name, digest, first)
+            elif digest:
+                contents = [(digest, item, name)]
+                self._upload_attachment(
+                    file_name, name, on_sent=functools.partial(self._release_uploads, contents),
+                    on_success=functools.partial(self._register_uploads, contents)
+                )
+            else:
+                self._upload_attachment(file_name, name)
+
+    def _skip_duplicate_logs(self, key, item, root, files):
+        """
+        Leaves the files uploaded before out of the archive, their references are logged instead.
+        The contents of the other files are registered once the archive was uploaded.
+
+        Returns: files to archive
+        """
+        if self.attachment_index is None or not files:
+            return files
+        archive_name = item + ARCHIVE_FORMATS[self.archive_format]
+        kept, duplicates, contents = [], [], []
+        for file_name in files:
+            name = '{0}/{1}'.format(archive_name, os.path.relpath(file_name, root))
+            # the archives are prefetched before the previous ones are uploaded, they can not wait for them
+            digest, first = self.attachment_index.lookup(file_name, wait=False)
+            if first:
+                duplicates.append((name, digest, first))
+            else:
+                kept.append(file_name)
+                if digest:
+                    contents.append((digest, item, name))
+        if duplicates:
+            self.duplicate_attachments[key] = duplicates
+        if contents:
+            self.archived_contents[key] = contents
+        return kept
+
+    def _archive_pipeline(self):
+        if self.archives is None:
+            self.archives = ArchivePipeline(
+                self.archive_workers, self.archive_format, self.archive_level, self.archive_tmp_dir,
+                senders=self.folder_workers,
+            )
+        return self.archives
+
+    def _failed_case_logs(self, prepared):
+        """
+        Returns: (archive key, archive name, logs path, log files) for failed test cases, None for the others
+        """
+        case = prepared.case
+        if case.status != 'FAILED':
+            return None
+        path = self.strategy.get_logs_per_test_path(case)
+        files = self._logs_of_case(case, path)
+        if files is None or self._is_finished(prepared.key):
+            return None
+        root = os.path.join(self.test_logs, path)
+        files = self._skip_duplicate_logs(id(case), case.name, root, files)
+        if not files and id(case) in self.duplicate_attachments:
+            return None
+        return id(case), case.name, root, files
+
+    def upload_zipped_test_case_attachments(self, zip_file_name, path, key=None):
+        archives = self._archive_pipeline()
+        # the archive might have been already prefetched
+        if key is None or not (archives.is_pending(key) or key in self.duplicate_attachments):
+            whole_path = os.path.join(self.test_logs, path)
+            files = self._log_index().files(path)
+            if files is None:
+                logger.warning("Path (%s) with log files does not exist!" % (whole_path, ))
+                return
+            key = object()
+            files = self._skip_duplicate_logs(key, zip_file_name, whole_path, files)
+            if files or key not in self.duplicate_attachments:
+                archives.submit(key, zip_file_name, whole_path, files)
+
+        for name, digest, first in self.duplicate_attachments.pop(key, []):
+            self._log_duplicate(name, digest, first)
+        contents = self.archived_contents.pop(key, [])
+        archive = archives.result(key) if archives.is_pending(key) else None
+        if not archive:
+            self._release_uploads(contents)
+            return
+        self._upload_attachment(
+            archive, os.path.basename(archive), delete_after=True,
+            on_sent=functools.partial(self._release_uploads, contents, archives.release),
+            on_success=functools.partial(self._register_uploads, contents)
+        )
+
+    def _send_log(self, msg, level):
+        if self._skip_log():
+            return
+        with self.metrics.phase('logs'):
+            self.service.log(
+                time=timestamp(),
+                message=msg,
+                level=level
+            )
+
+    def _attach_message(self, msg, name, level, inline_msg):
+        """
+        Attaches the whole message gzipped, inline_msg is the text of the log entry.
+        """
+        fd, path = tempfile.mkstemp(suffix='.log.gz', dir=self.archive_tmp_dir)
+        data = memoryview(msg.encode('utf-8'))
+        with os.fdopen(fd, 'wb') as fh:
+            for chunk in gzip_chunks(data[start:start + ATTACHMENT_CHUNK_SIZE]
+                                     for start in range(0, len(data), ATTACHMENT_CHUNK_SIZE)):
+                fh.write(chunk)
+        self._upload_attachment(
+            path, name + '.log.gz', delete_after=True, message=inline_msg, level=level, mime='application/gzip'
         )
 
+    def _log_message_to_rp_console(self, msg, level, name='message'):
+        if not isinstance(msg, str):
+            return self._send_log(msg, level)
+
+        with self.metrics.phase('logs'):
+            messages, attach = self.message_budget.plan(msg)
+        if attach:
+            # the last inline message goes with the attachment
+            inline_msg = messages.pop()
+        for message in messages:
+            self._send_log(message, level)
+        if attach:
+            with self.metrics.phase('attachments'):
+                self._attach_message(msg, name, level, inline_msg)
+
     def _process_failed_case(self, case):
-        msg = self.strategy.extract_failure_msg_from_xunit(case)
-        self._log_message_to_rp_console(msg, "ERROR")
+        with self.metrics.phase('strategy'):
+            msg = self.strategy.extract_failure_msg_from_xunit(case)
+        self._log_message_to_rp_console(msg, "ERROR", name='failure')
 
     def store_launch_info(self, dest):
         launch_url = self.launch_public_url % self.launch_id
@@ -401,7 +3271,8 @@ class RpManager:
             "rp_launch_name": self.launch_name,
             "rp_launch_tags": self.launch_tags,
             "rp_launch_desc": self.launch_description,
-            "rp_launch_id":   self.launch_id
+            "rp_launch_id":   self.launch_id,
+            "rp_cli_metrics": self.metrics.as_dict(),
         }
         with open(dest, "w") as file:
             json.dump(json_data, file)
@@ -411,101 +3282,623 @@ class RpManager:
 
         if self.zipped:
             # zip logs per test and upload zip file
-            self.upload_zipped_test_case_attachments("{0}".format(case.get('@name')), path_to_logs_per_test)
+            self.upload_zipped_test_case_attachments(
+                "{0}".format(case.name), path_to_logs_per_test, key=id(case)
+            )
         else:
             # upload logs per tests one by one and do not zip them
-            self.upload_test_case_attachments("{0}/{1}".format(self.test_logs, path_to_logs_per_test))
+            if self._logs_of_case(case, path_to_logs_per_test):
+                self.upload_test_case_attachments(path_to_logs_per_test, item=case.name)
 
     def _open_new_folder(self, folder_name):
+        self.folders_opened += 1
+        self._use_worker()
+        if self.journal is not None:
+            self.folders_seen[folder_name] += 1
+            self.folder_key = '{0}#{1}'.format(folder_name, self.folders_seen[folder_name])
+            state = self.journal.folders.get(self.folder_key)
+            if state:
+                return self.service.resume_item(state['id'])
+
         self.service.start_test_item(
             name=folder_name,
             start_time=timestamp(),
             item_type="SUITE",
         )
+        if self.journal is not None:
+            self.service.checkpoint('folder', key=self.folder_key)
 
     def _close_folder(self):
+        if self.journal is not None:
+            if self.journal.folders.get(self.folder_key, {}).get('finished'):
+                return self.service.leave_item()
+
         self.service.finish_test_item(end_time=timestamp(), status=None)
+        if self.journal is not None:
+            self.service.checkpoint('folder_end', key=self.folder_key)
 
-    def feed_results(self):
-        self._start_launch()
+    @staticmethod
+    def _keyed(xml):
+        """
+        Yields (key, prepared case), the occurrence makes the repeated names unique.
+        """
+        seen = collections.Counter()
+        for prepared in xml:
+            name = '{0}.{1}'.format(prepared.case.classname, prepared.case.name)
+            seen[name] += 1
+            yield '{0}#{1}'.format(name, seen[name]), prepared
 
-        with open(self.xunit_feed) as fd:
-            data = xmltodict.parse(fd.read())
+    def _with_journal_keys(self, xml):
+        """
+        Sets the key of the test cases.
+        """
+        for key, prepared in self._keyed(xml):
+            yield prepared._replace(key=key)
 
-        xml = data.get("testsuite").get("testcase")
+    def _with_digest(self, xml):
+        """
+        Records the digest of the test cases, with --rerun_of only the ones which changed since that launch
+        are yielded.
+        """
+        for key, prepared in self._keyed(xml):
+            case_hash = self.run_digest.add(key, prepared.case)
+            if self.previous_digest is not None and self.previous_digest.get(key) == case_hash:
+                self.unchanged_cases += 1
+                continue
+            yield prepared
 
-        # if there is only 1 test case, convert 'xml' from dict to list
-        # otherwise, 'xml' is always list
-        if not isinstance(xml, list):
-            xml = [xml]
+    def _save_digest(self):
+        if self.rerun_of:
+            logger.info("%s test cases did not change since the launch %s", self.unchanged_cases, self.rerun_of)
+        if self.failed_requests or not self.launch_id:
+            logger.warning('Not writing the digest of the launch, some requests failed')
+            return
+        self.run_digest.save(self.launch_id)
 
-        xml = sorted(xml, key=lambda k: k['@classname'])
+    def _is_finished(self, key):
+        return key is not None and self.journal.items.get(key, {}).get('finished', False)
 
-        for case in xml:
-            issue = None
-            name = self.strategy.get_testcase_name(case)
-            description = self.strategy.get_testcase_description(case)
-            tags = self.strategy.get_tags(case, test_owners=self.test_owners)
+    def _iter_cases(self):
+        xunit_files = expand_xunit_feed(self.xunit_feed)
+        workers = min(self.parse_workers or multiprocessing.cpu_count(), len(xunit_files))
 
-            if self.strategy.should_create_folders_in_launch():
+        if workers <= 1:
+            for xunit_file in xunit_files:
+                cases = self.metrics.timed('parse', parse_xunit(xunit_file, self.streaming))
+                for prepared in prepare_cases(self.strategy, cases, self.test_owners, self.metrics):
+                    yield prepared
+            return
+
+        pool = futures_process.ProcessPoolExecutor(max_workers=workers)
+        # the shards are parsed at the same time but reported in order, every one sends its test cases
+        # through its own bounded queue, so at most workers * (PARSE_QUEUE_CHUNKS + 1) chunks are in memory
+        manager = multiprocessing.Manager()
+        pending = collections.deque()
+        xunit_files = iter(xunit_files)
+
+        def submit(xunit_file):
+            chunks = manager.Queue(PARSE_QUEUE_CHUNKS)
+            future = pool.submit(
+                _prepare_shard, xunit_file, self.strategy, self.test_owners, self.streaming, chunks)
+            pending.append((xunit_file, chunks, future))
+
+        try:
+            for xunit_file in itertools.islice(xunit_files, workers):
+                submit(xunit_file)
+
+            while pending:
+                xunit_file, chunks, future = pending[0]
+                while True:
+                    try:
+                        with self.metrics.phase('parse'):
+                            chunk = chunks.get(timeout=1)
+                    except queue.Empty:
+                        if future.done():
+                            # the worker failed before it finished the shard
+                            future.result()
+                        continue
+                    if chunk is None:
+                        break
+                    for prepared in chunk:
+                        yield prepared
+
+                pending.popleft()
+                logger.info("Parsed %s: %s test cases", xunit_file, future.result())
+                for next_file in itertools.islice(xunit_files, 1):
+                    submit(next_file)
+        finally:
+            # unblocks the workers still sending test cases
+            manager.shutdown()
+            pool.shutdown(wait=False)
+
+    def _report_case(self, prepared):
+        issue = None
+        case, name, description, tags, key = prepared
+
+        if self.strategy.should_create_folders_in_launch():
+            with self.metrics.phase('strategy'):
                 open_new_folder, folder_name = self.strategy.create_folder(case)
-                if self.strategy.is_first_folder():
-                    if open_new_folder:
-                        self._open_new_folder(folder_name)
-                elif open_new_folder:  # in case a new folder should be open, need to close last one and open new one
-                    self._close_folder()
+                first_folder = self.strategy.is_first_folder()
+            if first_folder:
+                if open_new_folder:
                     self._open_new_folder(folder_name)
+            elif open_new_folder:  # in case a new folder should be open, need to close last one and open new one
+                self._close_folder()
+                self._open_new_folder(folder_name)
 
-            self.service.start_test_item(
-                name=name[:255],
-                description=description,
-                tags=tags,
-                start_time=timestamp(),
-                item_type="STEP",
-            )
-            # Create text log message with INFO level.
-            if case.get('system_out'):
-                self._log_message_to_rp_console(case.get('system_out'), "INFO")
-
-            if 'skipped' in case:
-                issue = {"issue_type": "NOT_ISSUE"}  # this will cause skipped test to not be "To Investigate"
-                status = 'SKIPPED'
-                if case.get('skipped'):
-                    self._log_message_to_rp_console(case.get('skipped').get('@message'), "DEBUG")
-                else:
-                    self._log_message_to_rp_console('No skip message is provided', "DEBUG")
-            elif case.get('failure') or case.get('error'):  # Error or failed cases
-                status = 'FAILED'
-                self._process_failed_case(case)
+        if self._is_finished(key):
+            self.resumed_items += 1
+            # keep the summary of the log index complete, the zipped logs were looked up by the prefetch
+            if self.test_logs and not self.zipped and case.status == 'FAILED':
+                self._logs_of_case(case, self.strategy.get_logs_per_test_path(case))
+            return
 
-                if self.test_logs:
-                    self.attach_logs_to_failed_case(case)
+        if self.workers:
+            if not self.strategy.should_create_folders_in_launch():
+                # no folders, the test cases of a class are sent by the same worker
+                self._use_worker(case.classname or '')
+            self._wait_for_worker()
+
+        state = self.journal.items.get(key) if key is not None else None
+        if state:
+            # started before the run was interrupted: send only the missing logs and finish it
+            self.service.resume_item(state['id'])
+            self.logs_to_skip = state['logs']
+        else:
+            with self.metrics.phase('item_start'):
+                self.service.start_test_item(
+                    name=name[:255],
+                    description=description,
+                    tags=tags,
+                    start_time=timestamp(),
+                    item_type="STEP",
+                )
+            if key is not None:
+                self.service.checkpoint('item', key=key)
+        # Create text log message with INFO level.
+        self.message_budget.start_case()
+        system_out = case.system_out
+        if system_out:
+            self._log_message_to_rp_console(system_out, "INFO", name='system_out')
+
+        status = case.status
+        if status == 'SKIPPED':
+            issue = {"issue_type": "NOT_ISSUE"}  # this will cause skipped test to not be "To Investigate"
+            if case.get('skipped'):
+                self._log_message_to_rp_console(case.skip_message, "DEBUG")
             else:
-                status = 'PASSED'
+                self._log_message_to_rp_console('No skip message is provided', "DEBUG")
+        elif status == 'FAILED':  # Error or failed cases
+            self._process_failed_case(case)
+
+            if self.test_logs:
+                with self.metrics.phase('attachments'):
+                    self.attach_logs_to_failed_case(case)
+        with self.metrics.phase('item_finish'):
             self.service.finish_test_item(end_time=timestamp(), status=status, issue=issue)
+        self.logs_to_skip = 0
+        if key is not None:
+            self.service.checkpoint('item_end', key=key)
 
-        if self.strategy.should_create_folders_in_launch():
+    def feed_results(self):
+        if self.journal is not None:
+            self.journal.open(self.resume)
+            if self.journal.launch_finished:
+                logger.info("The launch %s was already finished", self.journal.launch_id)
+                self.launch_id = self.journal.launch_id
+                self.journal.close()
+                return
+
+        with self.metrics.phase('launch_start'):
+            self._start_launch()
+
+        # closing stops the parser pool when the reporting fails
+        with contextlib.closing(self._iter_cases()) as xml:
+            if self.run_digest is not None:
+                xml = self._with_digest(xml)
+
+            # only the folders need the cases ordered, each team is then reported in one go
+            if self.strategy.should_create_folders_in_launch():
+                xml = self.metrics.timed(
+                    'sort', external_sort(xml, key=lambda k: k.case.classname, buffer_size=self.sort_buffer)
+                )
+
+            if self.journal is not None:
+                xml = self._with_journal_keys(xml)
+
+            # archive the logs of the upcoming failed cases while the previous ones are uploaded
+            if self.zipped and self.test_logs:
+                xml = self.metrics.timed(
+                    'attachments', self._archive_pipeline().prefetch(xml, self._failed_case_logs)
+                )
+
+            for prepared in xml:
+                self._report_case(prepared)
+
+        # no folder is open when there was no test case (to report)
+        if self.folders_opened:
             self._close_folder()
 
         # Finish launch.
         self._end_launch()
+
+        if self.archives is not None:
+            self.archives.close()
+        if self.log_index is not None:
+            self._log_index_summary()
+        if self.attachment_index is not None:
+            self._attachment_index_summary()
+        if self.run_digest is not None:
+            self._save_digest()
+
+    def replay_spool(self, spool_dir):
+        """
+        Sends the operations recorded by --spool to report portal.
+        """
+        blobs_dir = os.path.join(spool_dir, SPOOL_BLOBS_DIR)
+        for op, args in self.metrics.timed('parse', read_spool(spool_dir)):
+            if op not in SPOOL_OPERATIONS:
+                logger.error("Unknown operation %s in the spool %s", op, spool_dir)
+                sys.exit(1)
+            if op == 'start_launch':
+                self.launch_name = args['name']
+                self.launch_description = args['description']
+                self.launch_tags = args['tags']
+            elif op == 'log_file':
+                args['path'] = os.path.join(blobs_dir, args.pop('blob'))
+
+            with self.metrics.phase('replay'):
+                getattr(self.service, op)(**args)
+
+        with self.metrics.phase('launch_finish'):
+            self.service.terminate()
+        self.launch_id = self.service.launch_id
+        logger.info(
+            'Replayed the spool %s to the launch %s: %s log entries in %s batch requests',
+            spool_dir, self.launch_id, self.service.logs_count, self.service.log_batches_count
+        )
 # End class RpManager
 
 
+class InotifyWatcher(object):
+    """
+    Reports the files closed after writing or moved into a directory, with inotify (Linux).
+    """
+
+    def __init__(self, path):
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        if libc.inotify_add_watch(self.fd, os.fsencode(path), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, os.strerror(error))
+
+    def wait(self, timeout):
+        """
+        Returns: names of the completed files, None if events were lost and the directory has to be scanned
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        # the kernel returns whole events only
+        data = os.read(self.fd, 64 * 1024)
+        names = []
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if name:
+                names.append(os.fsdecode(name))
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher(object):
+    """
+    Reports the files of a directory whose size and modification time did not change
+    between two scans, every interval seconds.
+    """
+
+    def __init__(self, path, interval=DEFAULT_WATCH_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.next_scan = 0
+        self.stamps = {}
+
+    def wait(self, timeout):
+        delay = self.next_scan - time.time()
+        if delay > timeout:
+            time.sleep(timeout)
+            return []
+        time.sleep(max(delay, 0))
+        self.next_scan = time.time() + self.interval
+
+        stamps = {}
+        for entry in os.scandir(self.path):
+            try:
+                status = entry.stat()
+            except OSError:
+                continue
+            stamps[entry.name] = (status.st_size, status.st_mtime_ns)
+        stable = [name for name, stamp in stamps.items() if self.stamps.get(name) == stamp]
+        self.stamps = stamps
+        return stable
+
+    def close(self):
+        pass
+
+
+def create_watcher(path, interval=DEFAULT_WATCH_INTERVAL):
+    try:
+        watcher = InotifyWatcher(path)
+        logger.info("Watching %s with inotify", path)
+    except (OSError, AttributeError) as error:
+        watcher = PollingWatcher(path, interval)
+        logger.info("Polling %s every %ss (inotify: %s)", path, interval, error)
+    return watcher
+
+
+class WatchDaemon(object):
+    """
+    Feeds the xunit files appearing in the --watch directory to report portal, each one into its own launch.
+
+    The files are reported by a pool of worker threads, every file by its own RpManager and
+    strategy instance. The managers share the HTTP connections, the rate control and the
+    compiled test_owners of the configuration. The launch info of every file is written
+    to <file name>.rp_cli.json in --watch_out_dir (default: the watched directory), a file
+    with an up to date launch info is not reported again.
+    """
+
+    def __init__(self, config, strategy_class):
+        self.config = config
+        self.strategy_class = strategy_class
+        self.watch_dir = config.get('watch')
+        self.out_dir = config.get('watch_out_dir') or self.watch_dir
+        self.patterns = config.get('watch_pattern') or WATCH_PATTERNS
+        self.interval = config.get('watch_interval') or DEFAULT_WATCH_INTERVAL
+        workers = config.get('watch_workers') or DEFAULT_WATCH_WORKERS
+        if not os.path.isdir(self.watch_dir):
+            logger.error("The watched directory %s does not exist", self.watch_dir)
+            sys.exit(1)
+        for option in ('xunit_feed', 'journal', 'spool', 'rerun_of', 'attachment_index'):
+            if config.get(option):
+                logger.error('--%s can not be used with --watch, every file is reported into its own launch', option)
+                sys.exit(1)
+
+        http_retries = config.get('http_retries')
+        http_backoff = config.get('http_backoff')
+        if (config.get('engine') or DEFAULT_ENGINE) == 'asyncio':
+            connections = config.get('connections') or DEFAULT_CONNECTIONS
+        else:
+            connections = config.get('folder_workers') or 1
+        self.http_adapter = RateLimitedAdapter(
+            RateController(config.get('max_rps')),
+            retries=DEFAULT_HTTP_RETRIES if http_retries is None else http_retries,
+            backoff=DEFAULT_HTTP_BACKOFF if http_backoff is None else http_backoff,
+            pool_connections=1, pool_maxsize=workers * connections,
+        )
+        self.stop = threading.Event()
+        self.seen = {}
+        self.slots = threading.BoundedSemaphore(workers * WATCH_QUEUE)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='rp-watch')
+        self.reported = 0
+        self.failed = 0
+
+    def _out_file(self, name):
+        return os.path.join(self.out_dir, '{0}.{1}'.format(name, DEFAULT_OUT_FILE))
+
+    def _report(self, path):
+        name = os.path.basename(path)
+        start = time.time()
+        rp = None
+        try:
+            config = dict(self.config, xunit_feed=[path])
+            rp = RpManager(config, strategy=self.strategy_class(), http_adapter=self.http_adapter)
+            rp.feed_results()
+            rp.store_launch_info(self._out_file(name))
+            self.reported += 1
+            logger.info("Reported %s to the launch %s in %.1fs", path, rp.launch_id, time.time() - start)
+        except (Exception, SystemExit):
+            self.failed += 1
+            logger.error("Failed to report %s", path, exc_info=True)
+            if rp is not None:
+                # do not leave the launch of a bad file open on the server
+                try:
+                    rp.stop_launch()
+                except (Exception, SystemExit):
+                    logger.error("Failed to stop the launch of %s", path, exc_info=True)
+        finally:
+            self.slots.release()
+
+    def _stamps(self):
+        """
+        Returns: file name -> (size, mtime) of the files in the watched directory
+        """
+        stamps = {}
+        for entry in os.scandir(self.watch_dir):
+            try:
+                status = entry.stat()
+            except OSError:
+                continue
+            stamps[entry.name] = (status.st_size, status.st_mtime_ns)
+        return stamps
+
+    def _queue_files(self, names):
+        for name in sorted(names):
+            if not any(fnmatch.fnmatch(name, pattern) for pattern in self.patterns):
+                continue
+            path = os.path.join(self.watch_dir, name)
+            try:
+                status = os.stat(path)
+            except OSError:
+                continue
+            # an empty file is still being written
+            if not stat.S_ISREG(status.st_mode) or not status.st_size:
+                continue
+            stamp = (status.st_size, status.st_mtime_ns)
+            if self.seen.get(path) == stamp:
+                continue
+            self.seen[path] = stamp
+            try:
+                if os.stat(self._out_file(name)).st_mtime_ns >= status.st_mtime_ns:
+                    continue
+            except OSError:
+                pass
+            # blocks while all the workers are busy and WATCH_QUEUE files per worker wait
+            self.slots.acquire()
+            logger.info("Queued %s", path)
+            self.pool.submit(self._report, path)
+
+    def run(self):
+        watcher = create_watcher(self.watch_dir, self.interval)
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.stop.set())
+        try:
+            # the files found at the start (or when events were lost) might still be written, they are
+            # queued if they did not change for an interval, the watcher reports the others once completed
+            unconfirmed = self._stamps()
+            confirm_at = time.time() + self.interval
+            while not self.stop.is_set():
+                names = watcher.wait(WATCH_TICK)
+                if names is None:
+                    unconfirmed = self._stamps()
+                    confirm_at = time.time() + self.interval
+                else:
+                    self._queue_files(names)
+                if unconfirmed and time.time() >= confirm_at:
+                    stamps = self._stamps()
+                    self._queue_files(name for name, stamp in unconfirmed.items() if stamps.get(name) == stamp)
+                    unconfirmed = {}
+        except KeyboardInterrupt:
+            pass
+        finally:
+            watcher.close()
+            logger.info("Stopped watching %s, waiting for the queued files", self.watch_dir)
+            self.pool.shutdown(wait=True)
+        logger.info("Reported %s files, %s failed", self.reported, self.failed)
+
+
+def _config_cache_path(config):
+    if not CONFIG_CACHE_DIR:
+        return None
+    # the pickled classes belong to __main__ when rp_cli runs as a script
+    name = hashlib.sha1('{0}:{1}'.format(__name__, os.path.abspath(config)).encode('utf-8')).hexdigest()
+    return os.path.join(CONFIG_CACHE_DIR, name + '.pickle')
+
+
+def _rp_cli_stamp():
+    # a new rp_cli version may compile the configuration differently
+    status = os.stat(os.path.abspath(__file__))
+    return status.st_mtime_ns, status.st_size
+
+
+def _is_private_dir(path):
+    # pickles are only loaded from a directory nobody else can write to
+    try:
+        status = os.stat(path)
+    except OSError:
+        return False
+    return status.st_uid == os.getuid() and not status.st_mode & 0o077
+
+
+def _split_test_owners(content):
+    """
+    Returns: the configuration file content without its top level test_owners block,
+             None when it has no such block
+    """
+    lines = content.splitlines(True)
+    for start, line in enumerate(lines):
+        if line.split(b'#', 1)[0].strip() != b'test_owners:':
+            continue
+        end = start + 1
+        # the block goes on with the indented, empty and comment lines
+        while end < len(lines) and (not lines[end].strip() or lines[end][:1] in (b' ', b'\t', b'#')):
+            end += 1
+        return b''.join(lines[:start] + lines[end:])
+    return None
+
+
+def _load_cached_owners(cache_path, stamp):
+    if not _is_private_dir(os.path.dirname(cache_path)):
+        return None
+    try:
+        with open(cache_path, 'rb') as cache:
+            cached_stamp, test_owners = pickle.load(cache)
+    except Exception:
+        return None
+    return test_owners if cached_stamp == stamp else None
+
+
+def _store_cached_owners(cache_path, stamp, test_owners):
+    cache_dir = os.path.dirname(cache_path)
+    try:
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+        if not _is_private_dir(cache_dir):
+            logger.debug('Not caching the test owners, %s is not private to the user', cache_dir)
+            return
+        with tempfile.NamedTemporaryFile(dir=cache_dir, delete=False) as cache:
+            pickle.dump((stamp, test_owners), cache, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(cache.name, cache_path)
+    except (OSError, IOError, pickle.PicklingError) as error:
+        logger.debug('Could not cache the test owners: %s', error)
+
+
+def _load_yaml(content):
+    # libyaml parser when PyYAML was built with it
+    return yaml.load(content, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+
+
 def parse_configuration_file(config):
     """
     Parses the configuration file.
 
+    The compiled test_owners are cached in CONFIG_CACHE_DIR until the file or rp_cli
+    is modified, the rest of the file (e.g. the rp_uuid token) is parsed every time.
+
     Returns: dictionary containing the configuration file data
     """
 
     try:
-        with open(config, 'r') as stream:
-            conf_data = yaml.load(stream)
+        with open(config, 'rb') as stream:
+            content = stream.read()
     except (OSError, IOError) as error:
         logger.error("Failed when opening config file. Error: %s", error)
         sys.exit(1)
 
+    conf_data = None
+    cache_path = _config_cache_path(config)
+    stamp = (hashlib.sha1(content).hexdigest(), _rp_cli_stamp())
+    other_settings = _split_test_owners(content) if cache_path else None
+    if other_settings is not None:
+        test_owners = _load_cached_owners(cache_path, stamp)
+        if test_owners is not None:
+            try:
+                conf_data = _load_yaml(other_settings)
+            except yaml.YAMLError:
+                # e.g. an alias of an anchor of the test_owners
+                conf_data = None
+            if isinstance(conf_data, dict):
+                conf_data['test_owners'] = test_owners
+            else:
+                conf_data = None
+
+    if conf_data is None:
+        conf_data = _load_yaml(content)
+        if isinstance(conf_data, dict) and conf_data.get('test_owners'):
+            conf_data['test_owners'] = TestOwners(conf_data['test_owners'])
+            if other_settings is not None:
+                _store_cached_owners(cache_path, stamp, conf_data['test_owners'])
+
     # Check configuration file:
     if not all(key in conf_data for key in ['rp_endpoint', 'rp_uuid', 'rp_project']):
         logger.error('Configuration file missing one of: rp_endpoint, rp_uuid or rp_project')
@@ -529,7 +3922,7 @@ def parser():
     )
     rp_parser.add_argument(
         "--upload_xunit", type=str, required=False,
-        help="launch_name.zip: zip file contains the xunit.xml",
+        help="launch_name.zip: zip file contains the xunit.xml, or xunit xml file / directory zipped on the fly",
     )
     rp_parser.add_argument(
         "--launch_name", type=str, required=False,
@@ -544,8 +3937,20 @@ def parser():
         help="Tags for that launch",
     )
     rp_parser.add_argument(
-        "--xunit_feed", type=str, required=False,
-        help="Parse xunit and feed data to report portal",
+        "--xunit_feed", type=str, required=False, nargs='+',
+        help="Parse xunit files (paths or glob patterns) and feed data to report portal in one launch",
+    )
+    rp_parser.add_argument(
+        "--parse_workers", type=int, required=False,
+        help="Number of processes parsing the xunit files (default: number of CPUs)",
+    )
+    rp_parser.add_argument(
+        "--streaming", action='store_true',
+        help="Parse the xunit incrementally instead of loading the whole document",
+    )
+    rp_parser.add_argument(
+        "--sort_buffer", type=int, required=False,
+        help="Number of test cases sorted in memory before spilling to disk (default %s)" % (DEFAULT_SORT_BUFFER, ),
     )
     rp_parser.add_argument(
         "--test_logs", type=str, required=False,
@@ -555,18 +3960,163 @@ def parser():
         "--zipped", action='store_true',
         help="True to upload the logs zipped to save time and traffic",
     )
+    rp_parser.add_argument(
+        "--log_index_workers", type=int, required=False,
+        help="Number of threads indexing the --test_logs tree (default %s)" % (DEFAULT_LOG_INDEX_WORKERS, ),
+    )
+    rp_parser.add_argument(
+        "--http_retries", type=int, required=False,
+        help="Retries of the failed report portal requests (default %s)" % (DEFAULT_HTTP_RETRIES, ),
+    )
+    rp_parser.add_argument(
+        "--http_backoff", type=float, required=False,
+        help="Exponential backoff factor of the retries in seconds (default %s)" % (DEFAULT_HTTP_BACKOFF, ),
+    )
+    rp_parser.add_argument(
+        "--max_rps", type=float, required=False,
+        help="Maximal number of requests per second sent to report portal (default: adapted to the server)",
+    )
+    rp_parser.add_argument(
+        "--http_connect_timeout", type=float, required=False,
+        help="Connect timeout of the import/verify/update requests and of the asyncio engine, 0 waits forever (default %s)" % (
+            DEFAULT_HTTP_CONNECT_TIMEOUT, ),
+    )
+    rp_parser.add_argument(
+        "--http_read_timeout", type=float, required=False,
+        help="Read timeout of the import/verify/update requests and of the asyncio engine, 0 waits forever (default %s)" % (
+            DEFAULT_HTTP_READ_TIMEOUT, ),
+    )
+    rp_parser.add_argument(
+        "--engine", required=False, choices=ENGINES,
+        help="Reporting engine: one background thread or asyncio with several connections (default %s)" % (
+            DEFAULT_ENGINE, ),
+    )
+    rp_parser.add_argument(
+        "--connections", type=int, required=False,
+        help="Number of concurrent connections of the asyncio engine (default %s)" % (DEFAULT_CONNECTIONS, ),
+    )
+    rp_parser.add_argument(
+        "--max_in_flight", type=int, required=False,
+        help="Maximal number of pending requests of the asyncio engine (default %s)" % (DEFAULT_MAX_IN_FLIGHT, ),
+    )
+    rp_parser.add_argument(
+        "--max_message_size", type=int, required=False,
+        help="Log messages bigger than this (bytes) are cut or split, 0 for no limit (default %s)" % (
+            DEFAULT_MAX_MESSAGE_SIZE, ),
+    )
+    rp_parser.add_argument(
+        "--max_case_log_size", type=int, required=False,
+        help="Bytes of log messages sent inline per test case, the rest is attached, 0 for no limit (default %s)" % (
+            DEFAULT_MAX_CASE_LOG_SIZE, ),
+    )
+    rp_parser.add_argument(
+        "--oversize_messages", required=False, choices=OVERSIZE_MODES,
+        help="Oversized messages: head and tail inline with the message attached, or split in parts (default %s)" % (
+            DEFAULT_OVERSIZE_MODE, ),
+    )
+    rp_parser.add_argument(
+        "--folder_workers", type=int, required=False,
+        help="Number of folders (or test classes if the strategy makes no folders) sent in parallel (default 1)",
+    )
+    rp_parser.add_argument(
+        "--log_batch_size", type=int, required=False,
+        help="Maximal number of log entries sent in one request (default %s)" % (DEFAULT_LOG_BATCH_SIZE, ),
+    )
+    rp_parser.add_argument(
+        "--log_batch_bytes", type=int, required=False,
+        help="Maximal size of log entries sent in one request (default %s)" % (DEFAULT_LOG_BATCH_BYTES, ),
+    )
+    rp_parser.add_argument(
+        "--zip_format", required=False, choices=sorted(ARCHIVE_FORMATS),
+        help="Archive format of --zipped logs (default %s)" % (DEFAULT_ARCHIVE_FORMAT, ),
+    )
+    rp_parser.add_argument(
+        "--zip_level", type=int, required=False,
+        help="Compression level of --zipped logs, 0-9 for zip and gztar, 1-22 for zstd (default %s)" % (
+            DEFAULT_ARCHIVE_LEVEL, ),
+    )
+    rp_parser.add_argument(
+        "--zip_workers", type=int, required=False,
+        help="Number of threads archiving --zipped logs (default %s)" % (DEFAULT_ARCHIVE_WORKERS, ),
+    )
+    rp_parser.add_argument(
+        "--zip_tmp_dir", type=str, required=False,
+        help="Directory for the temporary --zipped archives (default: system temp directory)",
+    )
+    rp_parser.add_argument(
+        "--attachment_max_size", type=int, required=False,
+        help="Attachments bigger than this (bytes) are truncated to their head and tail",
+    )
+    rp_parser.add_argument(
+        "--dedup_attachments", action="store_true", required=False,
+        help="Upload every distinct log file content once, its other copies are logged as references to it",
+    )
+    rp_parser.add_argument(
+        "--attachment_index", type=str, required=False,
+        help="File keeping the uploaded log file contents across launches, implies --dedup_attachments",
+    )
+    rp_parser.add_argument(
+        "--attachment_compress_threshold", type=int, required=False,
+        help="Attachments bigger than this (bytes) are gzipped while uploading",
+    )
     rp_parser.add_argument(
         "--log_file", type=str, required=False, default=LOG_FILE_NAME,
         help="Log filename for rp_cli (default %s)" % (LOG_FILE_NAME, ),
     )
+    rp_parser.add_argument(
+        "--spool", type=str, required=False,
+        help="Write the results of --xunit_feed to this directory instead of sending them, see --replay",
+    )
+    rp_parser.add_argument(
+        "--replay", type=str, required=False,
+        help="Send the results spooled to this directory by --spool to report portal",
+    )
+    rp_parser.add_argument(
+        "--watch", type=str, required=False,
+        help="Keep running and feed every xunit file written to this directory into its own launch",
+    )
+    rp_parser.add_argument(
+        "--watch_pattern", type=str, required=False, nargs='+',
+        help="File name patterns of the watched xunit files (default: %s)" % (' '.join(WATCH_PATTERNS), ),
+    )
+    rp_parser.add_argument(
+        "--watch_workers", type=int, required=False,
+        help="Number of watched files reported in parallel (default %s)" % (DEFAULT_WATCH_WORKERS, ),
+    )
+    rp_parser.add_argument(
+        "--watch_out_dir", type=str, required=False,
+        help="Directory of the launch info of the watched files (default: the watched directory)",
+    )
+    rp_parser.add_argument(
+        "--watch_interval", type=float, required=False,
+        help="Seconds between two scans of the watched directory when inotify is not available (default %s)" % (
+            DEFAULT_WATCH_INTERVAL, ),
+    )
+    rp_parser.add_argument(
+        "--digest_dir", type=str, required=False,
+        help="Directory keeping a digest of the test cases of every launch, see --rerun_of",
+    )
+    rp_parser.add_argument(
+        "--rerun_of", type=str, required=False,
+        help="Report only the test cases changed since this launch (its digest is in --digest_dir) into it",
+    )
+    rp_parser.add_argument(
+        "--journal", type=str, required=False,
+        help="Journal file recording the progress of --xunit_feed, so an interrupted run can be resumed",
+    )
+    rp_parser.add_argument(
+        "--resume", action="store_true", required=False,
+        help="Resume the launch of the --journal, sending only what was not sent yet",
+    )
     rp_parser.add_argument(
         "--log_level", required=False, default=DEFAULT_LOG_LEVEL,
         choices=LOG_LEVELS.keys(),
         help="Log level (default %s)" % (DEFAULT_LOG_LEVEL, ),
     )
     rp_parser.add_argument(
-        "--strategy", type=str, required=False, choices=STRATEGIES,
-        help="Strategies to handle the xunit file: {0}".format(STRATEGIES),
+        "--strategy", type=str, required=False,
+        help="Strategies to handle the xunit file: {0} or a strategy of the {1} entry points".format(
+            STRATEGIES, STRATEGY_ENTRY_POINTS),
     )
     rp_parser.add_argument(
         "--store_out_file", nargs="?", const=DEFAULT_OUT_FILE, default=False,
@@ -574,6 +4124,10 @@ def parser():
                 When no name specified
                 default name (%s) is used.""" % (DEFAULT_OUT_FILE, ),
     )
+    rp_parser.add_argument(
+        "--metrics_prom", type=str, required=False,
+        help="Write the timing and request metrics in Prometheus textfile format",
+    )
     return rp_parser
 
 
@@ -587,21 +4141,32 @@ if __name__ == "__main__":
     config_data = parse_configuration_file(args.config)
     config_data.update(args.__dict__)
 
+    zip_format = config_data.get('zip_format') or DEFAULT_ARCHIVE_FORMAT
+    zip_level = config_data.get('zip_level')
+    if zip_level is not None and not ARCHIVE_LEVELS[zip_format][0] <= zip_level <= ARCHIVE_LEVELS[zip_format][1]:
+        rp_parser.error('--zip_level of {0} archives must be between {1} and {2}.'.format(
+            zip_format, *ARCHIVE_LEVELS[zip_format]))
+
     if args.upload_xunit:
         rp = RpManager(config_data, strategy=Strategy())
         rp.import_results()
-    elif args.xunit_feed:
+    elif args.xunit_feed or args.watch:
         if not args.strategy:
-            rp_parser.error('You must specify --strategy if you use --xunit-feed.')
-        if args.strategy == 'Rhv':
-            rp = RpManager(config_data, strategy=Rhv())
-        elif args.strategy == 'Raut':
-            rp = RpManager(config_data, strategy=Raut())
-        elif args.strategy == 'Cfme':
-            rp = RpManager(config_data, strategy=Cfme())
-        elif args.strategy == 'Cnv':
-            rp = RpManager(config_data, strategy=Cnv())
-        rp.feed_results()
+            rp_parser.error('You must specify --strategy if you use --xunit-feed or --watch.')
+        strategy_class = load_strategy(args.strategy)
+        if strategy_class is None:
+            rp_parser.error('Unknown strategy {0}, choose from {1} or install a package providing it in the {2} '
+                            'entry points.'.format(args.strategy, STRATEGIES, STRATEGY_ENTRY_POINTS))
+        if args.watch:
+            WatchDaemon(config_data, strategy_class).run()
+        else:
+            rp = RpManager(config_data, strategy=strategy_class())
+            rp.feed_results()
+    elif args.replay:
+        # nothing is parsed, the requests can be pipelined right away
+        config_data['engine'] = config_data.get('engine') or 'asyncio'
+        rp = RpManager(config_data, strategy=Strategy())
+        rp.replay_spool(args.replay)
     else:
         logger.error("Bad command - see the usage!")
         rp_parser.print_help()
@@ -609,4 +4174,7 @@ if __name__ == "__main__":
     if rp is not None and args.store_out_file:
         rp.store_launch_info(args.store_out_file)
         logger.info("Output file generated in {}.".format(args.store_out_file))
+    if rp is not None and args.metrics_prom:
+        rp.metrics.write_prometheus(args.metrics_prom)
+        logger.info("Metrics written to {}.".format(args.metrics_prom))
     logger.info("Finish")
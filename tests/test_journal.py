@@ -0,0 +1,69 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rp_cli  # noqa: E402
+
+
+def write_journal(path, records, tail=''):
+    with open(path, 'w') as fh:
+        for record in records:
+            fh.write(json.dumps(record) + '\n')
+        fh.write(tail)
+
+
+def read_records(path):
+    with open(path) as fh:
+        return [json.loads(line) for line in fh]
+
+
+def test_resume_after_truncated_line(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    records = [
+        {'op': 'launch', 'id': 'launch-1'},
+        {'op': 'item', 'key': 'test_a#0', 'id': 'item-1'},
+    ]
+    write_journal(path, records, tail='{"op": "item_end", "ke')
+
+    journal = rp_cli.Journal(path)
+    journal.open(resume=True)
+    journal.write({'op': 'item_end', 'key': 'test_a#0'})
+    journal.close()
+
+    assert read_records(path) == records + [{'op': 'item_end', 'key': 'test_a#0'}]
+    resumed = rp_cli.Journal(path)
+    resumed.load()
+    assert resumed.launch_id == 'launch-1'
+    assert resumed.items['test_a#0'] == {'id': 'item-1', 'logs': 0, 'finished': True}
+
+
+def test_resume_after_truncated_first_line(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    write_journal(path, [], tail='{"op": "laun')
+
+    journal = rp_cli.Journal(path)
+    journal.open(resume=True)
+    journal.write({'op': 'launch', 'id': 'launch-1'})
+    journal.close()
+
+    assert read_records(path) == [{'op': 'launch', 'id': 'launch-1'}]
+
+
+def test_resume_keeps_complete_journal(tmp_path, monkeypatch):
+    # lines longer than the read block are searched across several blocks
+    monkeypatch.setattr(rp_cli, 'JOURNAL_READ_BLOCK', 16)
+    path = str(tmp_path / 'journal.jsonl')
+    records = [
+        {'op': 'launch', 'id': 'launch-1'},
+        {'op': 'item', 'key': 'test_with_a_long_name#0', 'id': 'item-1'},
+    ]
+    write_journal(path, records)
+
+    journal = rp_cli.Journal(path)
+    journal.open(resume=True)
+    journal.write({'op': 'logs', 'id': 'item-1', 'count': 3})
+    journal.close()
+
+    assert read_records(path) == records + [{'op': 'logs', 'id': 'item-1', 'count': 3}]